@@ -1,27 +1,68 @@
+# Imported first to start the startup clock before anything else loads.
+from guichat.startup import startup_report
+
+import argparse
 import asyncio
 import contextlib
+import functools
 import logging
 import os
+import signal
 import sys
 import socket
-from tkinter import messagebox
+import time
 
 import aionursery
-from aiofile import AIOFile
 from dotenv import load_dotenv
 from guichat.authorization import get_access_to_chat, InvalidToken
-from guichat.chat_reader import read_message
-from guichat.chat_writer import write_message
-from guichat.connection import create_connection
-from guichat.gui import (
-    draw,
-    TkAppClosed,
+from guichat.chat_reader import ChatMessage, read_chat_message
+from guichat.chat_writer import write_messages
+from guichat.connection import create_connections, ReconnectPolicy
+from guichat.dedup import RecentMessages
+from guichat.events import (
     NicknameReceived,
+    HistoryJump,
+    HistoryPageLoaded,
+    HistoryTrimmed,
+    JumpRequested,
+    LatestRequested,
+    PreviousPageRequested,
+    SearchResults,
     ReadConnectionStateChanged,
     SendingConnectionStateChanged
 )
-from guichat.utils import create_handy_nursery
-from guichat.watchdog import watch_for_connection, ping_pong
+from guichat.fanout import (
+    attach_to_daemon,
+    DaemonAlreadyRunning,
+    serve_windows,
+    Subscribers
+)
+from guichat.log import queued_logging
+from guichat.metrics import (
+    dump_metrics,
+    metrics,
+    SamplingProfiler,
+    serve_metrics,
+    toggle_profiler
+)
+from guichat.queues import (
+    BoundedQueue,
+    SpillQueue,
+    ThreadChannel,
+    ThreadWatermarkChannel,
+    WatermarkQueue
+)
+from guichat.utils import (
+    create_handy_nursery,
+    install_event_loop,
+    LOOP_BACKENDS,
+    run_in_thread
+)
+from guichat.watchdog import (
+    watch_for_connection,
+    ping_pong,
+    LivenessMonitor
+)
 
 
 logging.getLogger('asyncio').setLevel(logging.WARNING)
@@ -31,6 +72,29 @@ logging.getLogger('guichat.watchdog').setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+MODES = ('window', 'daemon', 'attach')
+
+reconnects = metrics.counter(
+    'chat_reconnects_total', 'Attempts to reconnect after a lost connection.'
+)
+disconnects = metrics.counter(
+    'chat_disconnects_total', 'Lost connections to the chat server.'
+)
+messages_sent = metrics.counter(
+    'chat_messages_sent_total', 'Messages sent to the chat server.'
+)
+send_latency = metrics.histogram(
+    'chat_send_latency_seconds',
+    'Time from a message entered to its batch written to the server.'
+)
+search_time = metrics.histogram(
+    'chat_search_seconds', 'Time to answer a history search.'
+)
+reconnect_time = metrics.histogram(
+    'chat_reconnect_seconds',
+    'Time from a lost connection to the next authorized one.'
+)
+
 
 class TokenNotFound(Exception):
     pass
@@ -38,34 +102,67 @@ class TokenNotFound(Exception):
 
 async def handle_connection(
         host, port_read, port_send, msgs_queue, send_queue,
-        status_queue, save_queue, watchdog_queue, history_file, token):
+        status_queue, save_queue, monitor, chat_history, token,
+        policy=None, recent=None):
+
+    loop = asyncio.get_running_loop()
+    policy = policy or ReconnectPolicy()
+    failures = 0
+    disconnected_at = None
+    connected_once = False
+    history_restored = False
 
     while True:
+        if disconnected_at is not None:
+            await asyncio.sleep(policy.delay(failures))
+            failures += 1
+            reconnects.inc()
+
         async with contextlib.AsyncExitStack() as stack:
             status_queue.put_nowait(ReadConnectionStateChanged.INITIATED)
             status_queue.put_nowait(SendingConnectionStateChanged.INITIATED)
 
-            reader_streams = await stack.enter_async_context(
-                create_connection(host, port_read)
-            )
-            writer_streams = await stack.enter_async_context(
-                create_connection(host, port_send)
-            )
-
-            status_queue.put_nowait(ReadConnectionStateChanged.ESTABLISHED)
-            status_queue.put_nowait(SendingConnectionStateChanged.ESTABLISHED)
-
+            liveness = None
             try:
+                # A single attempt: the backoff between attempts is the one
+                # above, so its exponent keeps growing across failures.
+                streams = await stack.enter_async_context(
+                    create_connections(host, (port_read, port_send))
+                )
+                reader_streams, writer_streams = streams
+
+                status_queue.put_nowait(ReadConnectionStateChanged.ESTABLISHED)
+                status_queue.put_nowait(
+                    SendingConnectionStateChanged.ESTABLISHED
+                )
+
+                liveness = monitor.register()
                 if token:
                     _, nickname = await get_access_to_chat(
                         *writer_streams,
-                        watchdog_queue,
+                        liveness,
                         token
                     )
 
                 status_queue.put_nowait(NicknameReceived(nickname))
 
-                await restore_chat_history(history_file, msgs_queue)
+                if disconnected_at is not None and connected_once:
+                    downtime = loop.time() - disconnected_at
+                    reconnect_time.observe(downtime)
+                    logger.debug(
+                        'Соединение восстановлено за %.2f сек.', downtime
+                    )
+                failures = 0
+                disconnected_at = None
+                connected_once = True
+
+                # After a reconnect the panel already shows everything
+                # received, and the server backlog is caught up with below.
+                if chat_history is not None and not history_restored:
+                    await restore_chat_history(chat_history, msgs_queue)
+                    history_restored = True
+                if recent is not None:
+                    recent.resume()
 
                 async with create_handy_nursery() as nursery:
                     reader, _ = reader_streams
@@ -75,21 +172,22 @@ async def handle_connection(
                             reader,
                             msgs_queue,
                             save_queue,
-                            watchdog_queue
+                            liveness,
+                            recent
                         )
                     )
                     nursery.start_soon(
                         send_msgs(
                             *writer_streams,
                             send_queue,
-                            watchdog_queue,
+                            liveness,
                         )
                     )
 
-                    nursery.start_soon(watch_for_connection(watchdog_queue))
+                    nursery.start_soon(watch_for_connection(liveness))
 
                     nursery.start_soon(
-                        ping_pong(*writer_streams, watchdog_queue)
+                        ping_pong(*writer_streams, liveness)
                     )
 
             except (
@@ -99,52 +197,158 @@ async def handle_connection(
                 aionursery.MultiError,
                 socket.gaierror
             ):
+                if disconnected_at is None:
+                    disconnected_at = loop.time()
+                    if connected_once:
+                        disconnects.inc()
                 continue
 
             finally:
+                if liveness is not None:
+                    monitor.unregister(liveness)
                 status_queue.put_nowait(ReadConnectionStateChanged.CLOSED)
                 status_queue.put_nowait(SendingConnectionStateChanged.CLOSED)
 
             break
 
 
-async def read_msgs(reader, msgs_queue, save_queue, watchdog_queue):
+async def read_msgs(reader, msgs_queue, save_queue, liveness, recent=None):
     while True:
-        message = await read_message(reader)
-        msgs_queue.put_nowait(message)
-        save_queue.put_nowait(message)
-        watchdog_queue.put_nowait('New message in chat')
+        message = await read_chat_message(reader)
+        liveness.touch()
+        if recent is not None and not recent.is_new(message.raw):
+            continue
+        await msgs_queue.put(message)
+        await save_queue.put(message)
 
 
-async def send_msgs(reader, writer, send_queue, watchdog_queue):
+async def send_msgs(reader, writer, send_queue, liveness):
     while True:
-        message = await send_queue.get()
-        await write_message(writer, message)
-        watchdog_queue.put_nowait('Message sent')
+        batch = [await send_queue.get()]
+        while not send_queue.empty():
+            batch.append(send_queue.get_nowait())
 
+        await write_messages(writer, [message for _, message in batch])
+        liveness.touch()
+        messages_sent.inc(len(batch))
 
-async def save_messages(filepath, save_queue):
-    try:
-        async with AIOFile(filepath, 'a') as afp:
-            while True:
-                message = await save_queue.get()
-                await afp.write(f'{message}\n')
-    except FileNotFoundError as err:
-        logger.exception(f'{err.strerror}: {err.filename}', exc_info=False)
-        pass
+        flushed_at = time.monotonic()
+        for enqueued_at, _ in batch:
+            send_latency.observe(flushed_at - enqueued_at)
+
+
+async def restore_chat_history(chat_history, msgs_queue):
+    lines = await chat_history.read_tail()
+    if lines:
+        msgs_queue.put_nowait('\n'.join(lines))
 
 
-async def restore_chat_history(filename, msgs_queue):
+async def load_history_pages(chat_history, history_queue, msgs_queue):
+    while True:
+        request = await history_queue.get()
+        if isinstance(request, PreviousPageRequested):
+            lines = await chat_history.read_previous_page()
+            msgs_queue.put_nowait(HistoryPageLoaded(lines))
+        elif isinstance(request, HistoryTrimmed):
+            chat_history.forget(request.lines_count)
+        elif isinstance(request, LatestRequested):
+            # The panel lost lines to a full queue and is redrawn.
+            msgs_queue.put_nowait(HistoryJump(await chat_history.read_tail()))
+
+
+async def answer_searches(
+        search_index, chat_history, search_queue, msgs_queue):
+    from guichat.search import parse_query
+
+    store = chat_history.store
+    while True:
+        request = await search_queue.get()
+        if isinstance(request, JumpRequested):
+            lines, position = await chat_history.read_around(request.seq)
+            msgs_queue.put_nowait(HistoryJump(lines, position))
+            continue
+        if isinstance(request, LatestRequested):
+            lines = await chat_history.read_tail()
+            msgs_queue.put_nowait(HistoryJump(lines))
+            continue
+
+        started_at = time.perf_counter()
+        try:
+            terms, since, until = parse_query(request.query)
+        except ValueError:
+            logger.warning(f'Неверный формат даты в запросе: {request.query}')
+            terms, since, until = [], None, None
+
+        first_seq = store.find_seq(since) if since else 0
+        end_seq = store.find_seq(until) if until else None
+        seqs = search_index.search(terms, first_seq, end_seq)
+        results = list(zip(seqs, await store.read_lines(seqs)))
+
+        elapsed = time.perf_counter() - started_at
+        search_time.observe(elapsed)
+        msgs_queue.put_nowait(SearchResults(results, elapsed))
+
+
+async def serve_window(
+        reader, writer, broadcast, status_broadcast, sending_queue, store,
+        search_index, page_size=1000, queue_size=10000):
+    from guichat.fanout import (
+        encode_event,
+        forward_frames,
+        is_chat_frame,
+        is_disconnect,
+        read_requests,
+        WindowChannel
+    )
+    from guichat.history import ChatHistory
+
+    # Every window has its own place in the history and its own searches,
+    # the chat lines and the connection status are shared by all of them.
+    frames = BoundedQueue(queue_size, 'drop-oldest', droppable=is_chat_frame)
+    window = WindowChannel(frames)
+    chat_history = ChatHistory(store, page_size)
+    history_queue = asyncio.Queue()
+    search_queue = asyncio.Queue()
+    recent = RecentMessages(page_size)
+
+    status_broadcast.subscribe(frames)
+    broadcast.subscribe(frames)
+    lines = await chat_history.read_tail()
+    # The page goes out first, the replayed lines it already holds are
+    # dropped the way a reconnect drops the server backlog. It replaces
+    # what a window attaching again still shows.
+    writer.write(encode_event(HistoryJump(lines)))
+    recent.remember_all(store.read_latest_raw(len(lines)))
+    recent.resume()
+
     try:
-        async with AIOFile(filename, 'r') as afp:
-            messages = await afp.read()
-            msgs_queue.put_nowait(messages.strip())
-    except FileNotFoundError as err:
-        logger.exception(f'{err.strerror}: {err.filename}', exc_info=False)
-        pass
+        async with create_handy_nursery() as nursery:
+            nursery.start_soon(forward_frames(writer, frames, recent))
+            nursery.start_soon(
+                read_requests(
+                    reader, sending_queue, history_queue, search_queue
+                )
+            )
+            nursery.start_soon(
+                load_history_pages(chat_history, history_queue, window)
+            )
+            nursery.start_soon(
+                answer_searches(
+                    search_index, chat_history, search_queue, window
+                )
+            )
+    except (ConnectionError, aionursery.MultiError) as err:
+        if not is_disconnect(err):
+            raise
+    finally:
+        broadcast.unsubscribe(frames)
+        status_broadcast.unsubscribe(frames)
+        writer.close()
 
 
 async def read_token_from_file(filepath):
+    from aiofile import AIOFile
+
     try:
         async with AIOFile(filepath, 'r') as afp:
             token = await afp.read()
@@ -154,7 +358,27 @@ async def read_token_from_file(filepath):
         raise TokenNotFound('Файл не найден', 'Файл с токеном не найден.')
 
 
-async def main():
+def process_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--loop',
+        choices=LOOP_BACKENDS,
+        default=os.getenv('CHAT_LOOP_BACKEND', 'asyncio'),
+        help='Event loop backend, uvloop is used only if installed.'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=MODES,
+        default=os.getenv('CHAT_MODE', 'window'),
+        help='A standalone window, a daemon that owns the connection and '
+             'the history, or a window attached to a running daemon.'
+    )
+
+    return parser.parse_args()
+
+
+async def main(mode='window'):
+    startup_report.mark('imports')
     logging.basicConfig(format='%(message)s')
 
     load_dotenv()
@@ -163,54 +387,327 @@ async def main():
     port_read = os.getenv('CHAT_PORT_READ')
     port_send = os.getenv('CHAT_PORT_SEND')
     history_file = os.getenv('CHAT_HISTORY_FILE', 'chat.history')
+    history_dir = os.getenv('CHAT_HISTORY_DIR', 'chat_history')
+    history_page_size = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 1000))
+    scrollback_lines = int(os.getenv('CHAT_SCROLLBACK_LINES', 5000))
+    tk_loop = os.getenv('CHAT_TK_LOOP', 'polling')
+    send_high_water = int(os.getenv('CHAT_SEND_HIGH_WATER', 100))
+    send_low_water = int(os.getenv('CHAT_SEND_LOW_WATER', 10))
+    segment_size = int(os.getenv('CHAT_HISTORY_SEGMENT_MB', 16)) * 1024 ** 2
+    compress_history = os.getenv('CHAT_HISTORY_COMPRESS', '') in ('1', 'true')
+    batch_messages = int(os.getenv('CHAT_HISTORY_BATCH_MESSAGES', 1000))
+    batch_bytes = int(os.getenv('CHAT_HISTORY_BATCH_KB', 1024)) * 1024
+    batch_latency = int(os.getenv('CHAT_HISTORY_BATCH_LATENCY_MS', 50)) / 1000
+    fsync_history = os.getenv('CHAT_HISTORY_FSYNC', '') in ('1', 'true')
+    reconnect_policy = ReconnectPolicy(
+        base_delay=float(os.getenv('CHAT_RECONNECT_BASE_DELAY', 0.5)),
+        max_delay=float(os.getenv('CHAT_RECONNECT_MAX_DELAY', 30)),
+        jitter=float(os.getenv('CHAT_RECONNECT_JITTER', 1)),
+    )
+    dedup_window = int(os.getenv('CHAT_DEDUP_WINDOW', 1000))
     token_file = os.getenv('CHAT_TOKEN_FILE', 'access_token.txt')
     chat_token = os.getenv('CHAT_TOKEN')
+    report_startup = os.getenv('CHAT_STARTUP_REPORT', '') in ('1', 'true')
+    metrics_port = os.getenv('CHAT_METRICS_PORT')
+    metrics_file = os.getenv('CHAT_METRICS_FILE')
+    metrics_interval = float(os.getenv('CHAT_METRICS_INTERVAL', 10))
+    profile_file = os.getenv('CHAT_PROFILE_FILE', 'chat.profile')
+    messages_queue_size = int(os.getenv('CHAT_MESSAGES_QUEUE_SIZE', 10000))
+    messages_overflow = os.getenv(
+        'CHAT_MESSAGES_QUEUE_OVERFLOW', 'drop-oldest'
+    )
+    status_queue_size = int(os.getenv('CHAT_STATUS_QUEUE_SIZE', 100))
+    save_queue_size = int(os.getenv('CHAT_SAVE_QUEUE_SIZE', 10000))
+    save_spill_file = os.getenv(
+        'CHAT_SAVE_SPILL_FILE', os.path.join(history_dir, 'save_queue.spill')
+    )
+
+    daemon_socket = os.getenv('CHAT_DAEMON_SOCKET', 'chat_daemon.sock')
+    network_thread = os.getenv('CHAT_NETWORK_THREAD', '') in ('1', 'true')
+
+    if mode == 'daemon':
+        # There is no window of its own, chat lines and status updates are
+        # fanned out to the attached ones.
+        messages_queue = Subscribers(history_page_size)
+        sending_queue = WatermarkQueue(send_high_water, send_low_water)
+        status_updates_queue = Subscribers()
+        history_queue = asyncio.Queue()
+        search_queue = asyncio.Queue()
+    elif network_thread:
+        # The window and the network live on different event loops, so
+        # everything crossing between them goes through thread channels.
+        # Only chat lines may be dropped, status updates are few and kept.
+        messages_queue = ThreadChannel(
+            messages_queue_size,
+            droppable=lambda message: isinstance(message, (ChatMessage, str))
+        )
+        sending_queue = ThreadWatermarkChannel(
+            send_high_water, send_low_water
+        )
+        status_updates_queue = ThreadChannel()
+        history_queue = ThreadChannel()
+        search_queue = ThreadChannel()
+    else:
+        # Only chat lines may be dropped from the panel, they are all in the
+        # history anyway. Status updates replace the queued ones of the same
+        # kind.
+        messages_queue = BoundedQueue(
+            messages_queue_size,
+            messages_overflow,
+            droppable=lambda message: isinstance(message, (ChatMessage, str))
+        )
+        sending_queue = WatermarkQueue(send_high_water, send_low_water)
+        status_updates_queue = BoundedQueue(status_queue_size, 'coalesce')
+        history_queue = asyncio.Queue()
+        search_queue = asyncio.Queue()
+    monitor = LivenessMonitor()
+    recent_messages = RecentMessages(dedup_window)
+    painted = asyncio.Event()
+
+    queues = {
+        'messages': messages_queue,
+        'send': sending_queue,
+        'status': status_updates_queue,
+        'history': history_queue,
+    }
+    for name, queue in queues.items():
+        metrics.gauge(
+            f'chat_{name}_queue_size', f'Items waiting in the {name} queue.',
+            queue.qsize
+        )
+    for name, queue in (('messages', messages_queue),
+                        ('status', status_updates_queue)):
+        metrics.counter(
+            f'chat_{name}_queue_dropped_total',
+            f'Items dropped or replaced in the full {name} queue.',
+            lambda queue=queue: queue.dropped
+        )
+    metrics.counter(
+        'chat_duplicates_dropped_total',
+        'Lines of the server backlog already received before a reconnect.',
+        lambda: recent_messages.dropped
+    )
+    if mode == 'daemon':
+        metrics.gauge(
+            'chat_daemon_windows', 'Windows attached to the daemon.',
+            lambda: len(messages_queue.queues)
+        )
+    metrics.gauge(
+        'chat_liveness_connections', 'Connections watched for timeouts.',
+        lambda: len(monitor.connections)
+    )
+    metrics.gauge(
+        'chat_liveness_idle_seconds', 'Longest silence of a connection.',
+        monitor.max_idle
+    )
+
+    profiler = SamplingProfiler()
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, toggle_profiler, profiler, profile_file
+        )
 
-    if chat_token is None:
-        chat_token = await read_token_from_file(token_file)
+    async def run_pipeline(chat_token):
+        # Everything the empty window does not need is loaded after it
+        # has been drawn.
+        from guichat.archive import import_archive, is_archive
+        from guichat.history import ChatHistory, save_messages
+        from guichat.search import keep_index_updated, SearchIndex
+        from guichat.storage import import_flat_history, open_history_store
+        startup_report.mark('deferred imports')
+
+        if chat_token is None:
+            chat_token = await read_token_from_file(token_file)
+        startup_report.mark('token')
+
+        # The history writer spills to disk instead of losing lines. Only
+        # the process writing the history has one, an attached window must
+        # not open the spill file of its daemon.
+        save_msgs_queue = SpillQueue(
+            save_queue_size, save_spill_file,
+            ChatMessage.dumps, ChatMessage.loads
+        )
+        metrics.gauge(
+            'chat_save_queue_size', 'Items waiting in the save queue.',
+            save_msgs_queue.qsize
+        )
+        metrics.counter(
+            'chat_save_queue_spilled_total', 'Messages spilled to disk.',
+            lambda: save_msgs_queue.spilled_total
+        )
 
-    messages_queue = asyncio.Queue()
-    sending_queue = asyncio.Queue()
-    status_updates_queue = asyncio.Queue()
-    save_msgs_queue = asyncio.Queue()
-    watchdog_queue = asyncio.Queue()
+        async with contextlib.AsyncExitStack() as stack:
+            stack.callback(save_msgs_queue.close)
+            store = await stack.enter_async_context(
+                open_history_store(history_dir, segment_size, compress_history)
+            )
+            if is_archive(history_file):
+                await import_archive(store, history_file)
+            else:
+                await import_flat_history(store, history_file)
+            chat_history = ChatHistory(store, history_page_size)
+            recent_messages.remember_all(store.read_latest_raw(dedup_window))
+            startup_report.mark('history store')
+
+            search_index = SearchIndex(os.path.join(history_dir, 'search'))
+            search_index.open()
+            stack.callback(search_index.close)
+
+            async with create_handy_nursery() as nursery:
+                nursery.start_soon(
+                    handle_connection(
+                        chat_server,
+                        port_read,
+                        port_send,
+                        messages_queue,
+                        sending_queue,
+                        status_updates_queue,
+                        save_msgs_queue,
+                        monitor,
+                        # Every attached window restores its own page.
+                        None if mode == 'daemon' else chat_history,
+                        chat_token,
+                        reconnect_policy,
+                        recent_messages
+                    )
+                )
 
-    async with create_handy_nursery() as nursery:
-        nursery.start_soon(
-            draw(messages_queue, sending_queue, status_updates_queue)
-        )
+                nursery.start_soon(monitor.run())
+
+                if metrics_port:
+                    nursery.start_soon(
+                        serve_metrics(
+                            metrics, profiler, '127.0.0.1', int(metrics_port)
+                        )
+                    )
 
-        nursery.start_soon(
-            handle_connection(
-                chat_server,
-                port_read,
-                port_send,
+                if metrics_file:
+                    nursery.start_soon(
+                        dump_metrics(metrics, metrics_file, metrics_interval)
+                    )
+
+                if mode == 'daemon':
+                    serve = functools.partial(
+                        serve_window,
+                        broadcast=messages_queue,
+                        status_broadcast=status_updates_queue,
+                        sending_queue=sending_queue,
+                        store=store,
+                        search_index=search_index,
+                        page_size=history_page_size,
+                        queue_size=messages_queue_size
+                    )
+                    nursery.start_soon(serve_windows(daemon_socket, serve))
+                else:
+                    nursery.start_soon(
+                        load_history_pages(
+                            chat_history, history_queue, messages_queue
+                        )
+                    )
+                    nursery.start_soon(
+                        answer_searches(
+                            search_index,
+                            chat_history,
+                            search_queue,
+                            messages_queue
+                        )
+                    )
+
+                nursery.start_soon(keep_index_updated(store, search_index))
+
+                nursery.start_soon(
+                    save_messages(
+                        store,
+                        save_msgs_queue,
+                        batch_messages,
+                        batch_bytes,
+                        batch_latency,
+                        fsync_history
+                    )
+                )
+
+                if report_startup:
+                    startup_report.log()
+
+    if mode == 'daemon':
+        await run_pipeline(chat_token)
+        return
+
+    # Only a process with a window loads Tk.
+    from guichat.gui import draw, TkAppClosed
+
+    async def run_window_pipeline(chat_token):
+        if mode == 'attach':
+            await attach_to_daemon(
+                daemon_socket,
                 messages_queue,
                 sending_queue,
                 status_updates_queue,
-                save_msgs_queue,
-                watchdog_queue,
-                history_file,
-                chat_token
+                history_queue,
+                search_queue
             )
-        )
+        else:
+            await run_pipeline(chat_token)
+
+    try:
+        async with create_handy_nursery() as nursery:
+            nursery.start_soon(
+                draw(
+                    messages_queue,
+                    sending_queue,
+                    status_updates_queue,
+                    history_queue,
+                    scrollback_lines,
+                    tk_loop,
+                    painted,
+                    search_queue
+                )
+            )
+
+            await painted.wait()
+            startup_report.mark('first paint')
 
-        nursery.start_soon(save_messages(history_file, save_msgs_queue))
+            if network_thread:
+                nursery.start_soon(
+                    run_in_thread(run_window_pipeline, chat_token)
+                )
+            else:
+                nursery.start_soon(run_window_pipeline(chat_token))
+    except TkAppClosed:
+        pass
 
 
 if __name__ == '__main__':
-    try:
-        asyncio.run(main())
-    except (
-        KeyboardInterrupt,
-        FileNotFoundError,
-        TkAppClosed,
-        InvalidToken,
-        TokenNotFound
-    ) as err:
-
-        if isinstance(err, TokenNotFound):
-            title, message = err.args
-            messagebox.showinfo(title, message)
-
-        sys.exit()
+    load_dotenv()
+    args = process_args()
+    install_event_loop(args.loop)
+
+    log_level = os.getenv('CHAT_LOG_LEVEL', 'INFO').upper()
+    logging.getLogger('guichat').setLevel(log_level)
+    logger.setLevel(log_level)
+
+    with queued_logging(os.getenv('CHAT_LOG_FILE')):
+        try:
+            asyncio.run(main(args.mode))
+        except (
+            KeyboardInterrupt,
+            FileNotFoundError,
+            InvalidToken,
+            TokenNotFound,
+            DaemonAlreadyRunning
+        ) as err:
+
+            dialog = isinstance(err, (TokenNotFound, InvalidToken))
+            if dialog and args.mode == 'daemon':
+                _, message = err.args
+                logger.error(message)
+            elif dialog:
+                from tkinter import messagebox
+
+                title, message = err.args
+                messagebox.showinfo(title, message)
+
+            if isinstance(err, DaemonAlreadyRunning):
+                logger.error(f'Демон чата уже запущен: {err}')
+
+            sys.exit()
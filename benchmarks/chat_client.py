@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from async_chat_gui import handle_connection
+from guichat.chat_reader import ChatMessage
+from guichat.dedup import DEFAULT_WINDOW, RecentMessages
+from guichat.events import NicknameReceived, ReadConnectionStateChanged
+from guichat.history import ChatHistory, save_messages
+from guichat.queues import WatermarkQueue
+from guichat.storage import open_history_store
+from guichat.utils import install_event_loop, LOOP_BACKENDS
+from guichat.watchdog import LivenessMonitor
+
+
+SYNTHETIC_MESSAGE = re.compile(r'#(\d+) @(\d+\.\d+)$')
+
+
+class ClientStats:
+
+    def __init__(self):
+        self.received = 0
+        self.duplicates = 0
+        self.last_id = 0
+        self.latencies = []
+        self.reconnect_times = []
+        self.disconnected_at = None
+        self.connected = asyncio.Event()
+
+    def percentile(self, values, share):
+        if not values:
+            return float('nan')
+        values = sorted(values)
+        return values[min(int(len(values) * share), len(values) - 1)]
+
+
+async def count_messages(msgs_queue, stats):
+    while True:
+        message = await msgs_queue.get()
+        received_at = time.time()
+        if isinstance(message, ChatMessage):
+            message = message.text
+        elif not isinstance(message, str):
+            continue
+
+        lines = message.split('\n')
+        restored = len(lines) > 1
+        for line in lines:
+            match = SYNTHETIC_MESSAGE.search(line)
+            if not match:
+                continue
+            # Restored history repeats lines that were already counted,
+            # the server backlog after a reconnect should not.
+            message_id = int(match.group(1))
+            if message_id <= stats.last_id:
+                if not restored:
+                    stats.duplicates += 1
+                continue
+            stats.last_id = message_id
+            stats.received += 1
+            stats.latencies.append(received_at - float(match.group(2)))
+
+
+async def track_connection(status_queue, stats):
+    while True:
+        status = await status_queue.get()
+        if status is ReadConnectionStateChanged.CLOSED:
+            stats.disconnected_at = time.monotonic()
+            stats.connected.clear()
+        elif isinstance(status, NicknameReceived):
+            if stats.disconnected_at is not None:
+                stats.reconnect_times.append(
+                    time.monotonic() - stats.disconnected_at
+                )
+                stats.disconnected_at = None
+            stats.connected.set()
+
+
+async def send_messages(send_queue, rate):
+    while True:
+        await asyncio.sleep(1 / rate)
+        send_queue.put_nowait((time.monotonic(), 'benchmark message'))
+
+
+async def run_client(args, stats):
+    msgs_queue = asyncio.Queue()
+    send_queue = WatermarkQueue()
+    status_queue = asyncio.Queue()
+    save_queue = asyncio.Queue()
+    monitor = LivenessMonitor()
+    recent = RecentMessages(args.dedup_window) if args.dedup_window else None
+
+    with tempfile.TemporaryDirectory() as history_dir:
+        async with open_history_store(history_dir) as store:
+            chat_history = ChatHistory(store)
+            coroutines = [
+                handle_connection(
+                    args.host, args.read_port, args.send_port,
+                    msgs_queue, send_queue, status_queue, save_queue,
+                    monitor, chat_history, args.token,
+                    recent=recent
+                ),
+                monitor.run(),
+                save_messages(store, save_queue),
+                count_messages(msgs_queue, stats),
+                track_connection(status_queue, stats),
+            ]
+            if args.send_rate:
+                coroutines.append(send_messages(send_queue, args.send_rate))
+
+            tasks = [asyncio.ensure_future(coro) for coro in coroutines]
+            try:
+                await asyncio.wait_for(stats.connected.wait(), timeout=10)
+                stats.received = 0
+                stats.latencies.clear()
+                await asyncio.sleep(args.duration)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                for task in tasks:
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@contextlib.contextmanager
+def run_fake_server(args):
+    command = [
+        sys.executable, '-m', 'benchmarks.fake_server',
+        '--host', args.host,
+        '--read-port', str(args.read_port),
+        '--send-port', str(args.send_port),
+        '--rate', str(args.rate),
+    ]
+    if args.replay:
+        command += ['--replay', args.replay]
+    if args.drop_every:
+        command += ['--drop-every', str(args.drop_every)]
+    if args.backlog:
+        command += ['--backlog', str(args.backlog)]
+
+    server = subprocess.Popen(command)
+    try:
+        wait_for_port(args.host, args.read_port)
+        wait_for_port(args.host, args.send_port)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_report(stats, duration, cpu_time):
+    print(f'messages received: {stats.received}')
+    print(f'read throughput: {stats.received / duration:.0f} msgs/s')
+    for share in (0.5, 0.9, 0.99):
+        latency = stats.percentile(stats.latencies, share)
+        print(f'latency p{share * 100:g}: {latency * 1000:.2f} ms')
+    print(f'latency max: {max(stats.latencies, default=0) * 1000:.2f} ms')
+    print(f'reconnects: {len(stats.reconnect_times)}')
+    print(f'duplicates after reconnects: {stats.duplicates}')
+    if stats.reconnect_times:
+        mean = sum(stats.reconnect_times) / len(stats.reconnect_times)
+        print(f'reconnect time mean: {mean * 1000:.1f} ms')
+        longest = max(stats.reconnect_times)
+        print(f'reconnect time max: {longest * 1000:.1f} ms')
+    print(f'CPU: {cpu_time / duration * 100:.1f} %')
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'peak RSS: {peak_rss:.1f} MB')
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Headless chat client benchmark against a local fake '
+                    'server or a running one (--no-server).'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--read-port', type=int, default=15000)
+    parser.add_argument('--send-port', type=int, default=15050)
+    parser.add_argument('--token', default='benchmark')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument(
+        '--rate', type=int, default=1000,
+        help='Messages per second the fake server broadcasts.'
+    )
+    parser.add_argument(
+        '--send-rate', type=int, default=0,
+        help='Messages per second the client sends.'
+    )
+    parser.add_argument('--replay', help='History file the server replays.')
+    parser.add_argument(
+        '--drop-every', type=float,
+        help='The fake server drops connections every N seconds.'
+    )
+    parser.add_argument(
+        '--backlog', type=int, default=0,
+        help='The fake server sends the last N lines on every connect.'
+    )
+    parser.add_argument(
+        '--dedup-window', type=int, default=DEFAULT_WINDOW,
+        help='Recent lines remembered to drop repeats, 0 turns it off.'
+    )
+    parser.add_argument(
+        '--loops', nargs='+', choices=LOOP_BACKENDS, default=['asyncio'],
+        help='Event loop backends to compare, each runs in its own process.'
+    )
+    parser.add_argument(
+        '--no-server', action='store_true',
+        help='Connect to an already running server.'
+    )
+    return parser.parse_args()
+
+
+def run_benchmark(args, loop_backend):
+    loop_backend = install_event_loop(loop_backend)
+    stats = ClientStats()
+
+    cpu_started_at = time.process_time()
+    asyncio.run(run_client(args, stats))
+    cpu_time = time.process_time() - cpu_started_at
+
+    print(f'event loop: {loop_backend}')
+    print_report(stats, args.duration, cpu_time)
+
+
+def main():
+    args = process_args()
+
+    with contextlib.ExitStack() as stack:
+        if not args.no_server:
+            stack.enter_context(run_fake_server(args))
+
+        for loop_backend in args.loops:
+            benchmark = multiprocessing.Process(
+                target=run_benchmark, args=(args, loop_backend)
+            )
+            benchmark.start()
+            benchmark.join()
+
+
+if __name__ == '__main__':
+    main()
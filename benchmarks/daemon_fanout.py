@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import queue
+import resource
+import tempfile
+import time
+
+from benchmarks.chat_client import (
+    ClientStats,
+    count_messages,
+    run_client,
+    run_fake_server,
+    track_connection
+)
+from guichat.chat_reader import bytes_read
+from guichat.fanout import attach_to_daemon
+from guichat.queues import WatermarkQueue
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_report(role, stats=None):
+    report = {'role': role, 'rss': peak_rss(), 'bytes': bytes_read.value}
+    if stats is not None:
+        report['received'] = stats.received
+        report['p99'] = stats.percentile(stats.latencies, 0.99)
+    return report
+
+
+def run_standalone_window(args, results):
+    # What every window does on its own today: both server connections,
+    # the history store and its writer.
+    stats = ClientStats()
+    asyncio.run(run_client(args, stats))
+    results.put(make_report('window', stats))
+
+
+async def attach_window(args, stats):
+    msgs_queue = asyncio.Queue()
+    status_queue = asyncio.Queue()
+    coroutines = [
+        attach_to_daemon(
+            args.socket, msgs_queue, WatermarkQueue(), status_queue
+        ),
+        count_messages(msgs_queue, stats),
+        track_connection(status_queue, stats),
+    ]
+    tasks = [asyncio.ensure_future(coro) for coro in coroutines]
+    try:
+        await asyncio.wait_for(stats.connected.wait(), timeout=10)
+        stats.received = 0
+        stats.latencies.clear()
+        await asyncio.sleep(args.duration)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+def run_attached_window(args, results):
+    stats = ClientStats()
+    asyncio.run(attach_window(args, stats))
+    results.put(make_report('window', stats))
+
+
+async def serve_until(stop):
+    from async_chat_gui import main
+
+    daemon = asyncio.ensure_future(main('daemon'))
+    while not stop.is_set() and not daemon.done():
+        await asyncio.sleep(0.1)
+    daemon.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await daemon
+
+
+def run_daemon(args, history_dir, stop, results):
+    os.environ.update({
+        'CHAT_SERVER': args.host,
+        'CHAT_PORT_READ': str(args.read_port),
+        'CHAT_PORT_SEND': str(args.send_port),
+        'CHAT_TOKEN': args.token,
+        'CHAT_HISTORY_DIR': history_dir,
+        'CHAT_HISTORY_FILE': os.path.join(history_dir, 'chat.history'),
+        'CHAT_DAEMON_SOCKET': args.socket,
+    })
+    asyncio.run(serve_until(stop))
+    results.put(make_report('daemon'))
+
+
+def wait_for_socket(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'No daemon socket at {path}')
+        time.sleep(0.1)
+
+
+def run_windows(context, target, args, results):
+    windows = [
+        context.Process(target=target, args=(args, results))
+        for _ in range(args.windows)
+    ]
+    for window in windows:
+        window.start()
+    for window in windows:
+        window.join()
+    return collect_reports(results)
+
+
+def collect_reports(results):
+    # A window that failed to connect reports nothing.
+    reports = []
+    while True:
+        try:
+            reports.append(results.get(timeout=1))
+        except queue.Empty:
+            return reports
+
+
+def measure_standalone(context, args):
+    results = context.Queue()
+    return run_windows(context, run_standalone_window, args, results)
+
+
+def measure_daemon(context, args):
+    results = context.Queue()
+    stop = context.Event()
+    with tempfile.TemporaryDirectory() as history_dir:
+        args.socket = os.path.join(history_dir, 'chat_daemon.sock')
+        daemon = context.Process(
+            target=run_daemon, args=(args, history_dir, stop, results)
+        )
+        daemon.start()
+        wait_for_socket(args.socket)
+
+        reports = run_windows(context, run_attached_window, args, results)
+        stop.set()
+        daemon.join()
+    return reports + collect_reports(results)
+
+
+def print_row(mode, args, reports):
+    windows = [report for report in reports if report['role'] == 'window']
+    daemons = [report for report in reports if report['role'] == 'daemon']
+    if not windows:
+        print(f'{mode:>10} no window connected')
+        return
+    connections = 2 * (len(daemons) or len(windows))
+    read_mb = sum(report['bytes'] for report in reports) / 1024 ** 2
+    window_rss = sum(report['rss'] for report in windows) / len(windows)
+    daemon_rss = daemons[0]['rss'] if daemons else 0
+    received = sum(report['received'] for report in windows) / len(windows)
+    p99 = max(report['p99'] for report in windows)
+    print(
+        f'{mode:>10} {len(windows):>7} {connections:>11} {read_mb:>8.1f} '
+        f'{window_rss:>14.1f} {daemon_rss:>14.1f} '
+        f'{received / args.duration:>14.0f} {p99 * 1000:>8.2f}'
+    )
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Server connections, memory and delivery latency of N '
+                    'standalone clients against one daemon with N attached '
+                    'windows, both headless.'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--read-port', type=int, default=15000)
+    parser.add_argument('--send-port', type=int, default=15050)
+    parser.add_argument('--token', default='benchmark')
+    parser.add_argument('--windows', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument(
+        '--rate', type=int, default=1000,
+        help='Messages per second the fake server broadcasts.'
+    )
+    parser.set_defaults(
+        replay=None, drop_every=None, backlog=0, dedup_window=0, send_rate=0
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+    # Windows start from a clean interpreter, not a copy of this one.
+    context = multiprocessing.get_context('spawn')
+
+    with run_fake_server(args):
+        print(f'{"mode":>10} {"windows":>7} {"connections":>11} '
+              f'{"read, MB":>8} {"window RSS, MB":>14} '
+              f'{"daemon RSS, MB":>14} {"msgs/s/window":>14} '
+              f'{"p99, ms":>8}')
+        print_row('standalone', args, measure_standalone(context, args))
+        print_row('daemon', args, measure_daemon(context, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+GREETING = (
+    'Hello %username%! Enter your personal hash or leave it empty '
+    'to create new account.\n'
+)
+NICKNAME_PROMPT = 'Enter preferred nickname below:\n'
+WELCOME = (
+    'Welcome to chat! Post your message below. End it with an empty line.\n'
+)
+MESSAGE_SENT = 'Message send. Write more\n'
+
+TICK = 0.01
+MAX_CLIENT_BUFFER = 16 * 1024 * 1024
+
+
+def format_line(nickname, text):
+    timestamp = time.strftime('%d.%m.%y %H:%M')
+    return f'[{timestamp}] {nickname}: {text}\n'
+
+
+class FakeChatServer:
+
+    def __init__(self, rate=0, replay_lines=None, drop_every=None,
+                 backlog=0):
+        self.rate = rate
+        self.replay_lines = replay_lines
+        self.drop_every = drop_every
+        self.backlog = collections.deque(maxlen=backlog)
+        self.listeners = set()
+        self.speakers = set()
+        self.accounts = {}
+        self.sequence = itertools.count(1)
+
+    def broadcast(self, line):
+        if self.backlog.maxlen:
+            self.backlog.extend(line.splitlines(keepends=True))
+        data = line.encode()
+        for writer in list(self.listeners):
+            # A client that stopped reading is cut off instead of letting
+            # its buffer eat the server's memory.
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                writer.close()
+                self.listeners.discard(writer)
+                continue
+            writer.write(data)
+
+    def synthesize(self):
+        if self.replay_lines:
+            return next(self.replay_lines)
+        # Sequence number and send time let a client measure losses and
+        # end-to-end latency.
+        text = f'synthetic message #{next(self.sequence)} @{time.time():.6f}'
+        return format_line('Bot', text)
+
+    async def handle_listener(self, reader, writer):
+        # Like minechat, a new reader first gets the latest messages.
+        writer.write(''.join(self.backlog).encode())
+        self.listeners.add(writer)
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.listeners.discard(writer)
+            writer.close()
+
+    async def handle_speaker(self, reader, writer):
+        self.speakers.add(writer)
+        try:
+            nickname = await self.authorize(reader, writer)
+            if nickname is None:
+                return
+
+            text = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line:
+                    text.append(line)
+                    continue
+                if text:
+                    self.broadcast(format_line(nickname, ' '.join(text)))
+                    text = []
+                writer.write(MESSAGE_SENT.encode())
+        except ConnectionError:
+            pass
+        finally:
+            self.speakers.discard(writer)
+            writer.close()
+
+    async def authorize(self, reader, writer):
+        writer.write(GREETING.encode())
+        token = (await reader.readline()).decode().strip()
+
+        if token:
+            # A token is followed by the empty line closing the message.
+            await reader.readline()
+        else:
+            writer.write(NICKNAME_PROMPT.encode())
+            nickname = (await reader.readline()).decode().strip()
+            await reader.readline()
+            token = uuid.uuid4().hex
+            self.accounts[token] = nickname or f'anon_{token[:8]}'
+
+        # Any token is welcome, except the explicitly invalid one.
+        if token == 'invalid':
+            writer.write(b'null\n')
+            return None
+        if token not in self.accounts:
+            self.accounts[token] = f'user_{token[:8]}'
+
+        account = {'nickname': self.accounts[token], 'account_hash': token}
+        writer.write(f'{json.dumps(account)}\n{WELCOME}'.encode())
+        return self.accounts[token]
+
+    async def generate(self):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        produced = 0
+        while True:
+            await asyncio.sleep(TICK)
+            due = int((loop.time() - started_at) * self.rate)
+            lines = [self.synthesize() for _ in range(due - produced)]
+            produced = due
+            if lines:
+                self.broadcast(''.join(lines))
+
+    async def drop_connections(self):
+        while True:
+            await asyncio.sleep(self.drop_every)
+            logger.info('Dropping all client connections')
+            for writer in self.listeners | self.speakers:
+                writer.close()
+
+    async def serve(self, host, read_port, send_port):
+        listeners_server = await asyncio.start_server(
+            self.handle_listener, host, read_port
+        )
+        speakers_server = await asyncio.start_server(
+            self.handle_speaker, host, send_port
+        )
+        tasks = []
+        if self.rate:
+            tasks.append(asyncio.ensure_future(self.generate()))
+        if self.drop_every:
+            tasks.append(asyncio.ensure_future(self.drop_connections()))
+
+        async with listeners_server, speakers_server:
+            try:
+                await asyncio.gather(
+                    listeners_server.serve_forever(),
+                    speakers_server.serve_forever(),
+                    *tasks
+                )
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+def read_replay_lines(filepath):
+    with open(filepath) as replay_file:
+        lines = [line if line.endswith('\n') else f'{line}\n'
+                 for line in replay_file if line.strip()]
+    return itertools.cycle(lines)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for the minechat server.'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--read-port', type=int, default=5000)
+    parser.add_argument('--send-port', type=int, default=5050)
+    parser.add_argument(
+        '--rate', type=int, default=10,
+        help='Messages per second broadcast to readers.'
+    )
+    parser.add_argument(
+        '--replay', help='Broadcast lines of this file instead of '
+                         'synthetic messages.'
+    )
+    parser.add_argument(
+        '--drop-every', type=float,
+        help='Close all client connections every N seconds.'
+    )
+    parser.add_argument(
+        '--backlog', type=int, default=0,
+        help='Send the last N lines to every reader on connect.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    args = process_args()
+
+    replay_lines = read_replay_lines(args.replay) if args.replay else None
+    server = FakeChatServer(
+        args.rate, replay_lines, args.drop_every, args.backlog
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(server.serve(args.host, args.read_port, args.send_port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import time
+
+from guichat.chat_reader import read_message
+from guichat.chat_writer import write_message
+from guichat.framing import LineProtocol
+
+
+MESSAGE = '[01.01.19 12:00] Vlad: привет, как дела на сервере?'
+CHUNK_SIZE = 64 * 1024
+
+
+class NullTransport(asyncio.Transport):
+
+    def write(self, data):
+        pass
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+
+class NullWriter:
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def make_chunks(count):
+    data = f'{MESSAGE}\n'.encode() * count
+    return [
+        data[offset:offset + CHUNK_SIZE]
+        for offset in range(0, len(data), CHUNK_SIZE)
+    ]
+
+
+async def parse_with_stream_reader(chunks, count):
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    for _ in range(count):
+        await read_message(reader)
+
+
+async def parse_with_line_protocol(chunks, count):
+    protocol = LineProtocol(max_lines=count + 1)
+    protocol.connection_made(NullTransport())
+    for chunk in chunks:
+        protocol.data_received(chunk)
+    for _ in range(count):
+        await read_message(protocol)
+
+
+async def serialize(count):
+    writer = NullWriter()
+    for _ in range(count):
+        await write_message(writer, MESSAGE)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Parse and serialize throughput of the line framing.'
+    )
+    parser.add_argument('--messages', type=int, default=500000)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+    chunks = make_chunks(args.messages)
+
+    count = args.messages
+    cases = [
+        ('parse, StreamReader', parse_with_stream_reader(chunks, count)),
+        ('parse, LineProtocol', parse_with_line_protocol(chunks, count)),
+        ('serialize', serialize(count)),
+    ]
+    for title, coroutine in cases:
+        started_at = time.perf_counter()
+        asyncio.run(coroutine)
+        elapsed = time.perf_counter() - started_at
+        print(f'{title:<20} {count / elapsed:>12.0f} msgs/s')
+
+
+if __name__ == '__main__':
+    main()
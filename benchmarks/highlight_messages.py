@@ -0,0 +1,114 @@
+import argparse
+import itertools
+import random
+import statistics
+import time
+import tkinter as tk
+from tkinter.scrolledtext import ScrolledText
+
+from guichat.gui import append_messages
+from guichat.highlight import Highlighter
+
+
+NICKNAME = 'Vlad'
+NICKNAMES = [f'{name}{number}' for name in (
+    'Anonymous', 'Eva', 'Steve', 'Creeper', 'Alex', 'Миша', 'Оля'
+) for number in range(50)]
+WORDS = (
+    'привет как дела кто тут есть сервер опять лагает да нет ну ок спасибо '
+    'в шахте нашёл алмазы продам меч куплю кирку где база го пвп Vlad @Vlad'
+).split()
+
+
+def make_batches(batch_size):
+    counter = itertools.count()
+    while True:
+        yield [
+            f'[01.01.19 12:00] {random.choice(NICKNAMES)}: '
+            f'{" ".join(random.choices(WORDS, k=8))} #{next(counter)}'
+            for _ in range(batch_size)
+        ]
+
+
+def make_panel(root):
+    panel = ScrolledText(root, wrap='none')
+    panel.pack()
+    return panel
+
+
+def rescan(panel, highlighter):
+    # What highlighting by regex over the whole panel after an insert costs.
+    for tag in panel.tag_names():
+        panel.tag_remove(tag, '1.0', 'end')
+    lines = panel.get('1.0', 'end-1c').split('\n')
+    highlighter.highlight(lines, 1)
+
+
+def timed(function, *args):
+    started_at = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started_at
+
+
+def measure(total, batch_size, checkpoints):
+    root = tk.Tk()
+    root.withdraw()
+    plain_panel = make_panel(root)
+    panel = make_panel(root)
+    highlighter = Highlighter(panel)
+    highlighter.set_nickname(NICKNAME)
+
+    batches = make_batches(batch_size)
+    step = max(total // checkpoints // batch_size, 1)
+    plain_times, incremental_times = [], []
+    rows = []
+    for number in range(1, total // batch_size + 1):
+        batch = next(batches)
+        plain_times.append(timed(append_messages, plain_panel, batch))
+        incremental_times.append(
+            timed(append_messages, panel, batch, highlighter)
+        )
+        root.update_idletasks()
+
+        if number % step:
+            continue
+        rescan_time = timed(rescan, panel, highlighter)
+        rows.append((
+            number * batch_size,
+            statistics.median(plain_times[-step:]),
+            statistics.median(incremental_times[-step:]),
+            rescan_time,
+        ))
+
+    root.destroy()
+    return rows
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Per-message cost of highlighting nicknames and mentions '
+                    'as the conversation panel grows. Needs a display, e.g. '
+                    'run it under xvfb-run.'
+    )
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--checkpoints', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+    rows = measure(args.messages, args.batch, args.checkpoints)
+
+    print(f'{"panel lines":>11} {"plain, us":>10} {"highlighted, us":>16} '
+          f'{"full rescan, us":>16}')
+    for lines, plain, incremental, rescan_time in rows:
+        print(
+            f'{lines:>11} {plain / args.batch * 10 ** 6:>10.1f} '
+            f'{incremental / args.batch * 10 ** 6:>16.1f} '
+            f'{rescan_time / args.batch * 10 ** 6:>16.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
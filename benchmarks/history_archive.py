@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from guichat.archive import export_history, import_archive
+from guichat.storage import open_history_store
+
+
+NICKNAMES = [f'{name}{number}' for name in (
+    'Vlad', 'Anonymous', 'Eva', 'Steve', 'Creeper', 'Alex', 'Миша', 'Оля'
+) for number in ('', '_42', '2000')]
+WORDS = (
+    'привет как дела кто тут есть сервер опять лагает да нет ну ок спасибо '
+    'а что сегодня вечером будет ивент в шахте нашёл алмазы продам меч '
+    'куплю кирку где база у реки за горой го пвп кто онлайн всем пока '
+    'зомби скелет крипер взорвал дом мой лол ахах норм жесть помогите '
+    'hello hi gg wp lol ok thanks bye afk brb'
+).split()
+# Chat words follow Zipf's law, a few are in almost every message.
+CUM_WEIGHTS = list(itertools.accumulate(
+    1 / rank for rank in range(1, len(WORDS) + 1)
+))
+
+
+def make_lines(count):
+    timestamp = time.time() - count * 2
+    for _ in range(count):
+        timestamp += random.expovariate(0.5)
+        words = random.choices(
+            WORDS, cum_weights=CUM_WEIGHTS, k=random.randint(1, 15)
+        )
+        stamp = time.strftime('%d.%m.%y %H:%M', time.localtime(timestamp))
+        nickname = random.choice(NICKNAMES)
+        line = f'[{stamp}] {nickname}: {" ".join(words)}'
+        yield timestamp, line.encode()
+
+
+def read_lines(filepath):
+    timestamp = os.path.getmtime(filepath)
+    with open(filepath, 'rb') as history_file:
+        for line in history_file:
+            yield timestamp, line.rstrip(b'\n')
+
+
+async def fill_store(store, lines, batch_size=10000):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            await store.append_raw(batch)
+            batch = []
+    await store.append_raw(batch)
+
+
+def data_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for filename in os.listdir(directory)
+        if filename.endswith('.log')
+    )
+
+
+async def run_pass(source_dir, archive_path, target_dir, args, level):
+    async with open_history_store(source_dir) as store:
+        started_at = time.perf_counter()
+        await export_history(store, archive_path, args.chunk_lines, level)
+        export_time = time.perf_counter() - started_at
+    async with open_history_store(target_dir) as store:
+        started_at = time.perf_counter()
+        await import_archive(store, archive_path)
+        import_time = time.perf_counter() - started_at
+    return export_time, import_time
+
+
+async def traced_peak(coroutine_function, *args):
+    # Traced separately, tracing slows the timed passes down a lot.
+    tracemalloc.start()
+    await coroutine_function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+async def export_to(source_dir, archive_path, chunk_lines, level):
+    async with open_history_store(source_dir) as store:
+        await export_history(store, archive_path, chunk_lines, level)
+
+
+async def import_from(archive_path, target_dir):
+    async with open_history_store(target_dir) as store:
+        await import_archive(store, archive_path)
+
+
+async def measure(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = os.path.join(tmp_dir, 'source')
+        async with open_history_store(source_dir) as store:
+            if args.history:
+                await fill_store(store, read_lines(args.history))
+            else:
+                await fill_store(store, make_lines(args.messages))
+            messages_count = store.next_seq
+        raw_size = data_size(source_dir)
+        print(f'messages: {messages_count}, history data: '
+              f'{raw_size / 1024 ** 2:.1f} MB')
+
+        print(f'{"level":>5} {"ratio":>6} {"export, MB/s":>13} '
+              f'{"import, MB/s":>13} {"export peak, MB":>16} '
+              f'{"import peak, MB":>16}')
+        for level in args.levels:
+            archive_path = os.path.join(tmp_dir, f'history{level}.chz')
+            export_time, import_time = await run_pass(
+                source_dir, archive_path,
+                os.path.join(tmp_dir, f'target{level}'), args, level
+            )
+            ratio = raw_size / os.path.getsize(archive_path)
+
+            traced_path = os.path.join(tmp_dir, f'traced{level}.chz')
+            export_peak = await traced_peak(
+                export_to, source_dir, traced_path, args.chunk_lines, level
+            )
+            import_peak = await traced_peak(
+                import_from, traced_path,
+                os.path.join(tmp_dir, f'traced{level}')
+            )
+
+            megabytes = raw_size / 1024 ** 2
+            print(
+                f'{level:>5} {ratio:>6.1f} '
+                f'{megabytes / export_time:>13.1f} '
+                f'{megabytes / import_time:>13.1f} '
+                f'{export_peak / 1024 ** 2:>16.1f} '
+                f'{import_peak / 1024 ** 2:>16.1f}'
+            )
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Compression ratio, throughput and peak memory of the '
+                    'history archive export and import.'
+    )
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument(
+        '--history',
+        help='Flat history file to use instead of generated chat lines.'
+    )
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--chunk-lines', type=int, default=10000)
+    return parser.parse_args()
+
+
+def main():
+    asyncio.run(measure(process_args()))
+
+
+if __name__ == '__main__':
+    main()
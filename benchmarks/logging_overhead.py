@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from guichat.chat_reader import read_chat_message
+from guichat.log import queued_logging
+
+
+LINE = '[01.01.19 12:00] Vlad: привет, как дела на сервере?\n'.encode()
+LOG_FORMAT = '%(asctime)s %(name)s %(levelname)s %(message)s'
+
+
+class SlowFileHandler(logging.FileHandler):
+
+    def __init__(self, filename, write_delay):
+        super().__init__(filename, encoding='utf-8')
+        self.write_delay = write_delay
+
+    def emit(self, record):
+        # A busy or network disk: every write blocks for a while.
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        super().emit(record)
+
+
+class StaticReader:
+
+    async def readline(self):
+        return LINE
+
+
+@contextlib.contextmanager
+def logging_off(log_file, write_delay):
+    logging.getLogger('guichat').setLevel(logging.INFO)
+    yield
+
+
+@contextlib.contextmanager
+def file_logging(log_file, write_delay):
+    # Formatting and writing happen right in the loop, like basicConfig.
+    handler = SlowFileHandler(log_file, write_delay)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    logging.getLogger('guichat').setLevel(logging.DEBUG)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+
+
+@contextlib.contextmanager
+def queued_file_logging(log_file, write_delay):
+    logging.getLogger('guichat').setLevel(logging.DEBUG)
+    # The same slow handler, written to by the listener thread.
+    handler = SlowFileHandler(log_file, write_delay)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    try:
+        with queued_logging(log_format=LOG_FORMAT, stderr=False) as listener:
+            listener.handlers = (handler,)
+            yield
+    finally:
+        handler.close()
+
+
+MODES = {
+    'off': logging_off,
+    'file': file_logging,
+    'queued file': queued_file_logging,
+}
+
+
+async def read_messages(count):
+    reader = StaticReader()
+    latencies = []
+    for _ in range(count):
+        started_at = time.perf_counter()
+        await read_chat_message(reader)
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def measure_debug_call(count):
+    # What a disabled debug call costs when its message is built eagerly
+    # and when the arguments are left to the logging module.
+    logger = logging.getLogger('guichat.benchmark')
+    logger.setLevel(logging.INFO)
+    nickname, seq = 'Vlad', 42
+
+    started_at = time.perf_counter()
+    for _ in range(count):
+        logger.debug(f'Message #{seq} from {nickname}: {LINE!r}')
+    eager = (time.perf_counter() - started_at) / count
+
+    started_at = time.perf_counter()
+    for _ in range(count):
+        logger.debug('Message #%d from %s: %r', seq, nickname, LINE)
+    lazy = (time.perf_counter() - started_at) / count
+    return eager, lazy
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Per-message cost of reading a line with guichat debug '
+                    'logging off, written to a file in the event loop and '
+                    'handed to a background thread.'
+    )
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument(
+        '--write-delay', type=float, default=0,
+        help='Milliseconds every log write blocks, to mimic a slow disk.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    print(f'{"logging":>12} {"mean, us":>9} {"p99, us":>8} {"max, us":>8}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, mode in MODES.items():
+            log_file = os.path.join(tmp_dir, f'{name}.log')
+            with mode(log_file, args.write_delay / 1000):
+                latencies = asyncio.run(read_messages(args.messages))
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)]
+            print(
+                f'{name:>12} {statistics.mean(latencies) * 10 ** 6:>9.2f} '
+                f'{p99 * 10 ** 6:>8.2f} {latencies[-1] * 10 ** 6:>8.1f}'
+            )
+
+    eager, lazy = measure_debug_call(args.messages)
+    print(f'\ndisabled debug call: f-string {eager * 10 ** 9:.0f} ns, '
+          f'lazy arguments {lazy * 10 ** 9:.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from guichat.chat_reader import ChatMessage, decode_messages, decode_time
+
+
+NICKNAMES = ['Vlad', 'Anonymous', 'Eva', 'Steve', 'Creeper', 'Alex']
+WORDS = [
+    'привет', 'как', 'дела', 'сервер', 'опять', 'лагает', 'кто', 'онлайн',
+    'hello', 'world', 'ok', 'спасибо', 'нормально', 'сегодня', 'вечером',
+]
+
+
+def make_lines(count):
+    lines = []
+    for _ in range(count):
+        text = ' '.join(random.choices(WORDS, k=random.randint(2, 12)))
+        nickname = random.choice(NICKNAMES)
+        lines.append(f'[01.01.19 12:00] {nickname}: {text}\n'.encode())
+    return lines
+
+
+def receive_strings(lines):
+    # What read_message did with every line before the records.
+    messages = []
+    for data in lines:
+        data = data.rstrip()
+        started_at = time.perf_counter()
+        messages.append(data.decode())
+        decode_time.observe(time.perf_counter() - started_at)
+    return messages
+
+
+def receive_records(lines):
+    return [ChatMessage(None, time.time(), data.rstrip()) for data in lines]
+
+
+def save_strings(messages):
+    # What save_messages and the history store did with every line.
+    data = bytearray()
+    batch_size = 0
+    for message in messages:
+        batch_size += len(message.encode())
+        data += message.replace('\n', ' ').encode()
+        data += b'\n'
+    return data
+
+
+def save_records(messages):
+    data = bytearray()
+    batch_size = 0
+    for message in messages:
+        batch_size += len(message.raw)
+        data += message.raw
+        data += b'\n'
+    return data
+
+
+def render_strings(messages):
+    return '\n'.join(messages)
+
+
+def render_records(messages):
+    return decode_messages(messages)
+
+
+PATHS = {
+    'str': (receive_strings, save_strings, render_strings),
+    'record': (receive_records, save_records, render_records),
+}
+
+
+def measure_memory(receive, render, lines):
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    before, _ = tracemalloc.get_traced_memory()
+    messages = receive(lines)
+    queued, _ = tracemalloc.get_traced_memory()
+    queued_blocks = sys.getallocatedblocks() - blocks_before
+    render(messages)
+    rendered, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The list holding the messages is the same for both paths.
+    list_size = sys.getsizeof(messages)
+    count = len(lines)
+    return (
+        (queued - before - list_size) / count,
+        queued_blocks / count,
+        (rendered - before - list_size) / count,
+    )
+
+
+def measure_time(receive, save, render, lines, repeats):
+    timings = []
+    for _ in range(repeats):
+        started_at = time.perf_counter()
+        messages = receive(lines)
+        save(messages)
+        render(messages)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings) / len(lines)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Memory and time per message of plain strings and '
+                    'ChatMessage records on the way from the socket to the '
+                    'history file and the panel.'
+    )
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+    lines = make_lines(args.messages)
+
+    print(f'{"path":>7} {"queued, B":>10} {"blocks":>7} {"rendered, B":>12} '
+          f'{"pipeline, us":>13}')
+    for name, (receive, save, render) in PATHS.items():
+        queued, blocks, rendered = measure_memory(receive, render, lines)
+        per_message = measure_time(receive, save, render, lines, args.repeats)
+        print(f'{name:>7} {queued:>10.1f} {blocks:>7.2f} {rendered:>12.1f} '
+              f'{per_message * 10 ** 6:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import contextlib
+import time
+import tkinter as tk
+from tkinter.scrolledtext import ScrolledText
+
+from guichat.gui import update_conversation_history
+
+
+MESSAGE = '[01.01.19 12:00] Vlad: привет, как дела на сервере?'
+
+
+async def probe_frames(root, frame_times, interval=1 / 120):
+    while True:
+        started_at = time.perf_counter()
+        root.update()
+        await asyncio.sleep(interval)
+        frame_times.append(time.perf_counter() - started_at - interval)
+
+
+async def measure(total, max_batch):
+    root = tk.Tk()
+    root.withdraw()
+    panel = ScrolledText(root, wrap='none')
+    panel.pack()
+
+    messages_queue = asyncio.Queue()
+    for _ in range(total):
+        messages_queue.put_nowait(MESSAGE)
+
+    frame_times = []
+    tasks = [
+        asyncio.ensure_future(probe_frames(root, frame_times)),
+        asyncio.ensure_future(
+            update_conversation_history(
+                panel, messages_queue, max_batch=max_batch
+            )
+        ),
+    ]
+
+    started_at = time.perf_counter()
+    while not messages_queue.empty():
+        await asyncio.sleep(0.01)
+    root.update()
+    elapsed = time.perf_counter() - started_at
+
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    root.destroy()
+
+    return total / elapsed, max(frame_times, default=0)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Conversation panel rendering throughput. Needs a '
+                    'display, e.g. run it under xvfb-run.'
+    )
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument(
+        '--max-batch', type=int, nargs='+', default=[100, 1000],
+        help='Messages rendered per frame at most.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    print(f'{"max batch":>9} {"msgs/s":>9} {"worst frame, ms":>16}')
+    for max_batch in args.max_batch:
+        rate, worst_frame = asyncio.run(measure(args.messages, max_batch))
+        print(f'{max_batch:>9} {rate:>9.0f} {worst_frame * 1000:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiofile import AIOFile
+
+from guichat.history import ChatHistory
+from guichat.storage import import_flat_history, open_history_store
+
+
+NICKNAMES = ['Vlad', 'Anonymous', 'Eva', 'Steve', 'Creeper', 'Alex']
+WORDS = 'привет как дела майнкрафт сервер алмазы крипер шахта портал'.split()
+
+
+def generate_history(filepath, size_mb):
+    target_size = size_mb * 1024 * 1024
+    with open(filepath, 'w') as history_file:
+        while history_file.tell() < target_size:
+            lines = []
+            for _ in range(1000):
+                nickname = random.choice(NICKNAMES)
+                text = ' '.join(random.choices(WORDS, k=random.randint(3, 20)))
+                lines.append(f'[01.01.19 12:00] {nickname}: {text}\n')
+            history_file.write(''.join(lines))
+
+
+async def restore_full(filepath):
+    async with AIOFile(filepath, 'r') as afp:
+        messages = await afp.read()
+    return messages.strip()
+
+
+async def restore_tail(filepath, page_size):
+    async with open_history_store(f'{filepath}.d') as store:
+        return await ChatHistory(store, page_size).read_tail()
+
+
+async def build_store(filepath):
+    async with open_history_store(f'{filepath}.d') as store:
+        await import_flat_history(store, filepath)
+
+
+def run_child(filepath, mode, page_size):
+    started_at = time.perf_counter()
+    if mode == 'full':
+        asyncio.run(restore_full(filepath))
+    else:
+        asyncio.run(restore_tail(filepath, page_size))
+    elapsed = time.perf_counter() - started_at
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'elapsed': elapsed, 'peak_rss_kb': peak_rss_kb}))
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Restore time and peak RSS of chat history loading.'
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 100, 1024],
+        help='History file sizes in MB.'
+    )
+    parser.add_argument(
+        '--modes', nargs='+', default=['tail', 'full'],
+        choices=['tail', 'full']
+    )
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    if args.child:
+        run_child(args.child, args.modes[0], args.page_size)
+        return
+
+    print(f'{"size, MB":>9} {"mode":>5} {"time, s":>9} {"peak RSS, MB":>13}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size_mb in args.sizes:
+            filepath = os.path.join(tmp_dir, f'{size_mb}.history')
+            generate_history(filepath, size_mb)
+            asyncio.run(build_store(filepath))
+
+            for mode in args.modes:
+                output = subprocess.check_output([
+                    sys.executable, '-m', 'benchmarks.restore_history',
+                    '--child', filepath,
+                    '--modes', mode,
+                    '--page-size', str(args.page_size),
+                ])
+                result = json.loads(output)
+                print(
+                    f'{size_mb:>9} {mode:>5} {result["elapsed"]:>9.3f} '
+                    f'{result["peak_rss_kb"] / 1024:>13.1f}'
+                )
+
+            os.remove(filepath)
+            shutil.rmtree(f'{filepath}.d')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import contextlib
+import tempfile
+import time
+
+from guichat.chat_reader import ChatMessage
+from guichat.history import save_messages
+from guichat.storage import open_history_store
+
+
+MESSAGE = '[01.01.19 12:00] Vlad: привет, как дела на сервере?'.encode()
+TICK = 0.01
+
+
+async def produce(save_queue, rate, duration):
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    produced = 0
+    while produced < rate * duration:
+        due = min(int((loop.time() - started_at) * rate), rate * duration)
+        for _ in range(produced, due):
+            save_queue.put_nowait(ChatMessage(None, time.time(), MESSAGE))
+        produced = due
+        await asyncio.sleep(TICK)
+
+
+async def measure(rate, duration, batched, fsync):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        async with open_history_store(tmp_dir) as store:
+            save_queue = asyncio.Queue()
+            if batched:
+                writer = save_messages(store, save_queue, fsync=fsync)
+            else:
+                writer = save_messages(
+                    store, save_queue, max_messages=1, max_latency=0,
+                    fsync=fsync
+                )
+            writer_task = asyncio.ensure_future(writer)
+
+            started_at = time.perf_counter()
+            await produce(save_queue, rate, duration)
+            while store.next_seq < rate * duration:
+                await asyncio.sleep(TICK)
+            elapsed = time.perf_counter() - started_at
+
+            writer_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await writer_task
+
+    return store.next_seq / elapsed, elapsed - duration
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Throughput of per-message and batched history writes.'
+    )
+    parser.add_argument(
+        '--rates', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='Incoming messages per second.'
+    )
+    parser.add_argument('--duration', type=int, default=3, help='Seconds.')
+    parser.add_argument('--fsync', action='store_true')
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    print(f'{"rate":>7} {"mode":>8} {"written/s":>10} {"lag, s":>7}')
+    for rate in args.rates:
+        for batched in (False, True):
+            throughput, lag = asyncio.run(
+                measure(rate, args.duration, batched, args.fsync)
+            )
+            mode = 'batched' if batched else 'single'
+            print(f'{rate:>7} {mode:>8} {throughput:>10.0f} {lag:>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
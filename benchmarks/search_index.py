@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from guichat.search import parse_query, SearchIndex
+from guichat.storage import open_history_store
+
+
+NICKNAMES = ['Vlad', 'Anonymous', 'Eva', 'Steve', 'Creeper', 'Alex']
+# Word frequencies in chat follow Zipf's law, so a few words are in almost
+# every message and most of the vocabulary is rare.
+VOCABULARY = [f'слово{rank}' for rank in range(1, 50001)]
+CUM_WEIGHTS = list(itertools.accumulate(
+    1 / rank for rank in range(1, len(VOCABULARY) + 1)
+))
+
+QUERIES = {
+    'rare word': 'слово49999',
+    'common word': 'слово1',
+    'two words': 'слово2 слово50',
+    'nickname': '@eva слово10',
+    'time range': 'слово3 since:2019-01-02 until:2019-01-02',
+}
+# Every batch is stamped an hour after the previous one.
+FIRST_TIMESTAMP = time.mktime((2019, 1, 1, 0, 0, 0, 0, 0, -1))
+
+
+async def fill_store(store, messages_count, batch_size=10000):
+    for batch_number, first in enumerate(
+            range(0, messages_count, batch_size)):
+        lines = []
+        for _ in range(min(batch_size, messages_count - first)):
+            words = random.choices(
+                VOCABULARY, cum_weights=CUM_WEIGHTS, k=random.randint(3, 20)
+            )
+            nickname = random.choice(NICKNAMES)
+            lines.append(f'[01.01.19 12:00] {nickname}: {" ".join(words)}')
+        await store.append(lines, FIRST_TIMESTAMP + batch_number * 3600)
+
+
+async def measure(messages_count, run_size, repeats):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        async with open_history_store(os.path.join(tmp_dir, 'h')) as store:
+            await fill_store(store, messages_count)
+
+            search_index = SearchIndex(
+                os.path.join(tmp_dir, 'search'), run_size
+            )
+            search_index.open()
+
+            started_at = time.perf_counter()
+            await search_index.update(store)
+            await search_index.flush()
+            build_time = time.perf_counter() - started_at
+
+            index_size = sum(
+                os.path.getsize(run.path) for run in search_index.runs
+            )
+            print(f'messages: {messages_count}')
+            print(f'build: {messages_count / build_time:.0f} msgs/s, '
+                  f'{build_time:.1f} s')
+            print(f'index size: {index_size / 1024 ** 2:.1f} MB in '
+                  f'{len(search_index.runs)} runs')
+
+            print(f'{"query":>12} {"found":>6} {"median, ms":>11} '
+                  f'{"max, ms":>8}')
+            for name, query in QUERIES.items():
+                terms, since, until = parse_query(query)
+                first_seq = store.find_seq(since) if since else 0
+                end_seq = store.find_seq(until) if until else None
+
+                latencies = []
+                for _ in range(repeats):
+                    started_at = time.perf_counter()
+                    found = search_index.search(terms, first_seq, end_seq)
+                    latencies.append(time.perf_counter() - started_at)
+
+                print(
+                    f'{name:>12} {len(found):>6} '
+                    f'{statistics.median(latencies) * 1000:>11.2f} '
+                    f'{max(latencies) * 1000:>8.2f}'
+                )
+
+            search_index.close()
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Build throughput and query latency of the history '
+                    'search index.'
+    )
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--run-size', type=int, default=100000)
+    parser.add_argument('--repeats', type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+    asyncio.run(measure(args.messages, args.run_size, args.repeats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+LAST_STAGE = 'history store'
+
+
+def parse_report_line(line):
+    _, _, columns = line.partition('startup:')
+    elapsed, _, stage = [column.strip() for column in columns.split('|')]
+    return stage, float(elapsed)
+
+
+def parse_import_line(line):
+    _, _, columns = line.partition('import time:')
+    _, cumulative, module = columns.split('|')
+    return module.strip(), int(cumulative)
+
+
+def start_client(history_dir, history_file, importtime):
+    env = dict(
+        os.environ,
+        CHAT_STARTUP_REPORT='1',
+        CHAT_TOKEN='benchmark',
+        CHAT_SERVER='127.0.0.1',
+        CHAT_PORT_READ='1',
+        CHAT_PORT_SEND='1',
+        CHAT_HISTORY_DIR=history_dir,
+        CHAT_HISTORY_FILE=history_file or os.path.join(
+            history_dir, 'chat.history'
+        ),
+    )
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command.append('async_chat_gui.py')
+    return subprocess.Popen(
+        command, env=env, stderr=subprocess.PIPE, universal_newlines=True
+    )
+
+
+def measure_startup(history_file, importtime=False):
+    stages = {}
+    imports = []
+    with tempfile.TemporaryDirectory() as history_dir:
+        client = start_client(history_dir, history_file, importtime)
+        try:
+            for line in client.stderr:
+                if line.startswith('import time:') and '|' in line:
+                    if 'self [us]' not in line:
+                        imports.append(parse_import_line(line))
+                elif line.startswith('startup:') and '[ms]' not in line:
+                    stage, elapsed = parse_report_line(line)
+                    stages[stage] = elapsed
+                    if stage == LAST_STAGE:
+                        break
+        finally:
+            client.terminate()
+            client.wait()
+
+    if LAST_STAGE not in stages:
+        sys.exit('The client exited before the startup report.')
+    return stages, imports
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Time-to-first-paint of async_chat_gui.py and the '
+                    'stages after it. Needs a display, e.g. run it under '
+                    'xvfb-run, and is started from the project root.'
+    )
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument(
+        '--history',
+        help='Flat history file imported into the new history store.'
+    )
+    parser.add_argument(
+        '--slowest-imports', type=int, default=10,
+        help='Also print the N modules with the longest import time.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    runs = collections.defaultdict(list)
+    for _ in range(args.runs):
+        stages, _ = measure_startup(args.history)
+        for stage, elapsed in stages.items():
+            runs[stage].append(elapsed)
+
+    print(f'{"stage":>16} {"median, ms":>11} {"max, ms":>8}')
+    for stage, elapsed in runs.items():
+        print(
+            f'{stage:>16} {statistics.median(elapsed):>11.1f} '
+            f'{max(elapsed):>8.1f}'
+        )
+
+    if args.slowest_imports:
+        _, imports = measure_startup(args.history, importtime=True)
+        imports.sort(key=lambda item: item[1], reverse=True)
+        print(f'\n{"cumulative, ms":>14} module')
+        for module, cumulative in imports[:args.slowest_imports]:
+            print(f'{cumulative / 1000:>14.1f} {module}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import contextlib
+import random
+import statistics
+import time
+import tkinter as tk
+
+from guichat.gui import run_tk_loop, TK_LOOPS
+
+
+async def measure_idle_cpu(duration):
+    started_at = time.perf_counter()
+    cpu_started_at = time.process_time()
+    await asyncio.sleep(duration)
+    cpu_time = time.process_time() - cpu_started_at
+    return cpu_time / (time.perf_counter() - started_at) * 100
+
+
+async def measure_input_latency(entry, presses):
+    latencies = []
+    handled = asyncio.Event()
+
+    def on_key(event):
+        latencies.append(time.perf_counter() - pressed_at)
+        handled.set()
+
+    entry.bind('<Key>', on_key)
+    for _ in range(presses):
+        # Idle between presses so the adaptive loop has time to back off.
+        await asyncio.sleep(random.uniform(0.2, 0.5))
+        handled.clear()
+        pressed_at = time.perf_counter()
+        entry.event_generate('<Key>', keysym='a', when='tail')
+        await handled.wait()
+    return latencies
+
+
+async def measure(tk_loop, idle_duration, presses):
+    root = tk.Tk()
+    root.withdraw()
+    entry = tk.Entry(root)
+    entry.pack()
+
+    tk_task = asyncio.ensure_future(run_tk_loop(root, tk_loop))
+    idle_cpu = await measure_idle_cpu(idle_duration)
+    latencies = await measure_input_latency(entry, presses)
+
+    tk_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await tk_task
+    root.destroy()
+
+    return idle_cpu, statistics.median(latencies), max(latencies)
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Idle CPU and input latency of the Tk loop modes. Needs '
+                    'a display, e.g. run it under xvfb-run.'
+    )
+    parser.add_argument('--idle', type=int, default=10, help='Seconds.')
+    parser.add_argument('--presses', type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    print(f'{"mode":>9} {"idle CPU, %":>12} {"median, ms":>11} {"max, ms":>8}')
+    for tk_loop in TK_LOOPS:
+        idle_cpu, median, worst = asyncio.run(
+            measure(tk_loop, args.idle, args.presses)
+        )
+        print(
+            f'{tk_loop:>9} {idle_cpu:>12.2f} {median * 1000:>11.1f} '
+            f'{worst * 1000:>8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
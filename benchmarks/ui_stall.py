@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import contextlib
+import time
+
+from async_chat_gui import handle_connection
+from benchmarks.chat_client import ClientStats, count_messages, run_fake_server
+from guichat.events import ReadConnectionStateChanged
+from guichat.queues import ThreadChannel
+from guichat.utils import run_in_thread
+from guichat.watchdog import LivenessMonitor
+
+
+MODES = ('single', 'thread')
+
+
+async def run_network(args, msgs_queue, send_queue, status_queue, stats):
+    # Lines are counted where the history writer would take them, i.e. on
+    # the network side, while the GUI side is stalled.
+    save_queue = asyncio.Queue()
+    monitor = LivenessMonitor(args.timeout, args.timeout / 2)
+    coroutines = [
+        handle_connection(
+            args.host, args.read_port, args.send_port,
+            msgs_queue, send_queue, status_queue, save_queue,
+            monitor, None, args.token
+        ),
+        monitor.run(),
+        count_messages(save_queue, stats),
+    ]
+    tasks = [asyncio.ensure_future(coro) for coro in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+def count_disconnects(msgs_queue, status_queue):
+    disconnects = 0
+    while not msgs_queue.empty():
+        msgs_queue.get_nowait()
+    while not status_queue.empty():
+        status = status_queue.get_nowait()
+        if status is ReadConnectionStateChanged.CLOSED:
+            disconnects += 1
+    return disconnects
+
+
+async def run_gui(args, msgs_queue, status_queue):
+    disconnects = 0
+    for _ in range(args.stalls):
+        await asyncio.sleep(args.interval)
+        # Counted after the loop has run again, a stall only ends the
+        # connection once the watchdog gets to check it.
+        disconnects += count_disconnects(msgs_queue, status_queue)
+        # A slow Tk operation holds the thread without yielding.
+        time.sleep(args.stall)
+    await asyncio.sleep(args.interval)
+    return disconnects + count_disconnects(msgs_queue, status_queue)
+
+
+async def measure(args, mode):
+    stats = ClientStats()
+    if mode == 'thread':
+        msgs_queue, send_queue, status_queue = (
+            ThreadChannel(), ThreadChannel(), ThreadChannel()
+        )
+        network = run_in_thread(
+            run_network, args, msgs_queue, send_queue, status_queue, stats
+        )
+    else:
+        msgs_queue, send_queue, status_queue = (
+            asyncio.Queue(), asyncio.Queue(), asyncio.Queue()
+        )
+        network = run_network(
+            args, msgs_queue, send_queue, status_queue, stats
+        )
+
+    network_task = asyncio.ensure_future(network)
+    try:
+        disconnects = await run_gui(args, msgs_queue, status_queue)
+    finally:
+        network_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await network_task
+    return stats, disconnects
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Disconnects and network read latency while the GUI '
+                    'thread stalls, with the network on the same event '
+                    'loop or in its own thread.'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--read-port', type=int, default=15100)
+    parser.add_argument('--send-port', type=int, default=15150)
+    parser.add_argument('--token', default='benchmark')
+    parser.add_argument(
+        '--rate', type=int, default=200,
+        help='Messages per second. Lines that arrive during a stall are read '
+             'before the watchdog checks the connection after it, so only '
+             'an idle connection, --rate 0, is ended by every stall longer '
+             'than --timeout.'
+    )
+    parser.add_argument('--stall', type=float, default=2, help='Seconds.')
+    parser.add_argument('--stalls', type=int, default=5)
+    parser.add_argument(
+        '--interval', type=float, default=1,
+        help='Seconds of normal work between stalls.'
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=10,
+        help='Watchdog timeout of the connection in seconds.'
+    )
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    # Options of the fake server this benchmark does not vary.
+    parser.set_defaults(replay=None, drop_every=None, backlog=0)
+    return parser.parse_args()
+
+
+def main():
+    args = process_args()
+
+    print(f'{"mode":>7} {"disconnects":>12} {"read p50, ms":>13} '
+          f'{"read max, ms":>13}')
+    with run_fake_server(args):
+        for mode in args.modes:
+            stats, disconnects = asyncio.run(measure(args, mode))
+            median = stats.percentile(stats.latencies, 0.5)
+            worst = max(stats.latencies, default=0)
+            print(f'{mode:>7} {disconnects:>12} {median * 1000:>13.1f} '
+                  f'{worst * 1000:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+
+from dotenv import load_dotenv
+from async_chat_gui import handle_connection
+from guichat.events import (
+    NicknameReceived,
+    ReadConnectionStateChanged,
+)
+from guichat.utils import create_handy_nursery
+from guichat.watchdog import LivenessMonitor
+
+
+logging.getLogger('asyncio').setLevel(logging.CRITICAL)
+logging.getLogger('guichat').setLevel(logging.WARNING)
+
+logger = logging.getLogger(__name__)
+
+
+class SwarmStats:
+
+    def __init__(self):
+        self.received = 0
+        self.sent = 0
+        self.connected = 0
+        self.disconnects = 0
+        self.active = 0
+        # Connections that closed before authorization, retried by the
+        # session, and sessions that ended with an error, by its type.
+        self.connect_failures = 0
+        self.failed = 0
+        self.errors = collections.Counter()
+
+    def snapshot(self):
+        snapshot = collections.Counter({
+            name: value for name, value in vars(self).items()
+            if name != 'errors'
+        })
+        for error, count in self.errors.items():
+            snapshot[f'error {error}'] = count
+        return snapshot
+
+
+class ReceivedCounter:
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def put_nowait(self, message):
+        self.stats.received += 1
+
+    async def put(self, message):
+        self.put_nowait(message)
+
+
+class StatusCounter:
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.authorized = False
+
+    def put_nowait(self, status):
+        if isinstance(status, NicknameReceived):
+            self.authorized = True
+            self.stats.connected += 1
+            self.stats.active += 1
+        elif status is ReadConnectionStateChanged.CLOSED and self.authorized:
+            self.authorized = False
+            self.stats.disconnects += 1
+            self.stats.active -= 1
+        elif status is ReadConnectionStateChanged.CLOSED:
+            self.stats.connect_failures += 1
+
+
+class NullQueue:
+
+    def put_nowait(self, message):
+        pass
+
+    async def put(self, message):
+        pass
+
+
+async def send_periodically(send_queue, stats, interval):
+    while True:
+        await asyncio.sleep(interval)
+        send_queue.put_nowait((time.monotonic(), 'swarm message'))
+        stats.sent += 1
+
+
+async def run_session(
+        host, port_read, port_send, token, stats, send_rate, monitor):
+    # Incoming messages are only counted and nothing is stored, so a
+    # session costs no more than its sockets, tasks and two small queues.
+    send_queue = asyncio.Queue()
+
+    try:
+        async with create_handy_nursery() as nursery:
+            nursery.start_soon(
+                handle_connection(
+                    host, port_read, port_send,
+                    ReceivedCounter(stats),
+                    send_queue,
+                    StatusCounter(stats),
+                    NullQueue(),
+                    monitor,
+                    None,
+                    token
+                )
+            )
+            if send_rate:
+                nursery.start_soon(
+                    send_periodically(send_queue, stats, 1 / send_rate)
+                )
+    except Exception as err:
+        # A session that gives up, e.g. on an invalid token, is counted and
+        # the rest of the swarm goes on.
+        stats.failed += 1
+        stats.errors[type(err).__name__] += 1
+        logger.debug('Сессия %s завершилась с ошибкой: %r', token, err)
+
+
+async def report_periodically(stats, report_queue, interval):
+    while True:
+        await asyncio.sleep(interval)
+        report_queue.put((os.getpid(), stats.snapshot()))
+
+
+async def run_swarm(args, tokens, report_queue):
+    stats = SwarmStats()
+    # A single liveness monitor checks the deadlines of all sessions.
+    monitor = LivenessMonitor()
+    background_tasks = [
+        asyncio.ensure_future(
+            report_periodically(stats, report_queue, args.report_every)
+        ),
+        asyncio.ensure_future(monitor.run()),
+    ]
+
+    sessions = []
+    ramp_up_delay = args.ramp_up / max(len(tokens), 1)
+    for token in tokens:
+        sessions.append(asyncio.ensure_future(
+            run_session(
+                args.host, args.port_read, args.port_send, token, stats,
+                args.send_rate, monitor
+            )
+        ))
+        if ramp_up_delay:
+            await asyncio.sleep(ramp_up_delay)
+
+    await asyncio.sleep(args.duration)
+    report_queue.put((os.getpid(), stats.snapshot()))
+
+    for task in sessions + background_tasks:
+        task.cancel()
+    await asyncio.gather(
+        *sessions, *background_tasks, return_exceptions=True
+    )
+
+
+def run_worker(args, tokens, report_queue):
+    raise_files_limit()
+    asyncio.run(run_swarm(args, tokens, report_queue))
+
+
+def raise_files_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def read_tokens(args):
+    if args.tokens_file:
+        with open(args.tokens_file) as tokens_file:
+            # The token is the last field, after the username and a tab
+            # in the files user_registration.py --bulk writes.
+            tokens = [
+                line.strip().split('\t')[-1]
+                for line in tokens_file if line.strip()
+            ]
+        return tokens[:args.sessions]
+    return [f'{args.token_prefix}{number}' for number in range(args.sessions)]
+
+
+def print_report(snapshots, previous, interval, started_at):
+    total = sum(snapshots.values(), collections.Counter())
+    received_rate = (total['received'] - previous['received']) / interval
+    sent_rate = (total['sent'] - previous['sent']) / interval
+    print(
+        f'[{time.monotonic() - started_at:6.1f}s] '
+        f'active: {total["active"]}  '
+        f'connected: {total["connected"]}  '
+        f'disconnects: {total["disconnects"]}  '
+        f'failed connects: {total["connect_failures"]}  '
+        f'failed sessions: {total["failed"]}  '
+        f'received: {received_rate:.0f} msgs/s  '
+        f'sent: {sent_rate:.0f} msgs/s'
+    )
+    return total
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Run many headless chat sessions to load the server.'
+    )
+    parser.add_argument('--host', default=os.getenv('CHAT_SERVER'))
+    parser.add_argument('--port-read', default=os.getenv('CHAT_PORT_READ'))
+    parser.add_argument('--port-send', default=os.getenv('CHAT_PORT_SEND'))
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument(
+        '--tokens-file',
+        help='Tokens file of user_registration.py --bulk, one token per '
+             'session.'
+    )
+    parser.add_argument(
+        '--token-prefix', default='swarm-',
+        help='Tokens are generated from this prefix without --tokens-file.'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Worker processes to spread the sessions across.'
+    )
+    parser.add_argument(
+        '--send-rate', type=float, default=0,
+        help='Messages per second sent by every session.'
+    )
+    parser.add_argument(
+        '--ramp-up', type=float, default=10,
+        help='Seconds over which the sessions of a worker are started.'
+    )
+    parser.add_argument(
+        '--duration', type=float, default=60,
+        help='Seconds to keep the sessions running after the ramp-up.'
+    )
+    parser.add_argument('--report-every', type=float, default=5)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(format='%(message)s')
+
+    load_dotenv()
+
+    args = process_args()
+    tokens = read_tokens(args)
+
+    report_queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(args, tokens[number::args.workers], report_queue),
+            daemon=True
+        )
+        for number in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    started_at = time.monotonic()
+    snapshots = {}
+    previous = collections.Counter()
+    next_report_at = started_at + args.report_every
+    while any(worker.is_alive() for worker in workers):
+        try:
+            pid, snapshot = report_queue.get(timeout=0.5)
+            snapshots[pid] = snapshot
+        except queue.Empty:
+            pass
+
+        if time.monotonic() >= next_report_at:
+            previous = print_report(
+                snapshots, previous, args.report_every, started_at
+            )
+            next_report_at += args.report_every
+
+    total = sum(snapshots.values(), collections.Counter())
+    print(
+        f'Total: connected {total["connected"]}, '
+        f'disconnects {total["disconnects"]}, '
+        f'failed connects {total["connect_failures"]}, '
+        f'failed sessions {total["failed"]}, '
+        f'received {total["received"]}, sent {total["sent"]}'
+    )
+    for name, count in sorted(total.items()):
+        if name.startswith('error '):
+            print(f'  {name[len("error "):]}: {count}')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit()
@@ -0,0 +1,147 @@
+import asyncio
+import gzip
+import os
+import struct
+
+from .log import logger
+
+
+MAGIC = b'CHZ1'
+# magic, lines count, compressed size
+CHUNK_HEADER = struct.Struct('<4sIQ')
+TIMESTAMP = struct.Struct('<d')
+
+DEFAULT_CHUNK_LINES = 10000
+DEFAULT_LEVEL = 6
+PROGRESS_FILENAME = 'archive_import.progress'
+
+
+def is_archive(path):
+    try:
+        with open(path, 'rb') as archive_file:
+            return archive_file.read(len(MAGIC)) == MAGIC
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+def read_chunk_index(archive_file):
+    # Every chunk starts with a header, so walking the headers gives the
+    # index without decompressing anything. A chunk cut off by an
+    # interrupted export ends the index.
+    size = archive_file.seek(0, os.SEEK_END)
+    index = []
+    offset = 0
+    while offset + CHUNK_HEADER.size <= size:
+        archive_file.seek(offset)
+        magic, count, compressed_size = CHUNK_HEADER.unpack(
+            archive_file.read(CHUNK_HEADER.size)
+        )
+        end = offset + CHUNK_HEADER.size + compressed_size
+        if magic != MAGIC or end > size:
+            break
+        index.append((offset, count, compressed_size))
+        offset = end
+    return index, offset
+
+
+def pack_chunk(lines, level=DEFAULT_LEVEL):
+    # Each chunk is a standalone gzip member: the timestamps of its lines
+    # followed by the lines themselves.
+    timestamps = struct.pack(
+        f'<{len(lines)}d', *(timestamp for timestamp, _ in lines)
+    )
+    data = b'\n'.join(line for _, line in lines)
+    payload = gzip.compress(timestamps + data, level)
+    return CHUNK_HEADER.pack(MAGIC, len(lines), len(payload)) + payload
+
+
+def unpack_chunk(payload, count):
+    data = gzip.decompress(payload)
+    timestamps_size = count * TIMESTAMP.size
+    timestamps = struct.unpack_from(f'<{count}d', data)
+    lines = data[timestamps_size:].split(b'\n') if count else []
+    return list(zip(timestamps, lines))
+
+
+def iter_store_chunks(store, seq, chunk_lines):
+    while seq < store.next_seq:
+        lines = store.read_raw(seq, chunk_lines)
+        seq += len(lines)
+        yield lines
+
+
+def read_archive_chunk(archive_file, offset, count, compressed_size):
+    archive_file.seek(offset + CHUNK_HEADER.size)
+    return unpack_chunk(archive_file.read(compressed_size), count)
+
+
+async def export_history(
+        store, archive_path, chunk_lines=DEFAULT_CHUNK_LINES,
+        level=DEFAULT_LEVEL):
+
+    # An existing archive is continued: a torn last chunk is cut off and
+    # only the lines after the complete chunks are exported, so both an
+    # interrupted export and a repeated one pick up where they stopped.
+    loop = asyncio.get_running_loop()
+    exported = 0
+    with open(archive_path, 'ab+') as archive_file:
+        index, end = read_chunk_index(archive_file)
+        archive_file.truncate(end)
+        archived = sum(count for _, count, _ in index)
+
+        chunks = iter_store_chunks(
+            store, store.first_seq + archived, chunk_lines
+        )
+        for lines in chunks:
+            chunk = await loop.run_in_executor(
+                None, pack_chunk, lines, level
+            )
+            archive_file.write(chunk)
+            exported += len(lines)
+
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+
+    logger.debug('Выгружено в архив сообщений: %d', exported)
+    return exported
+
+
+async def import_archive(store, archive_path):
+    # The progress file tells an interrupted import of this archive from a
+    # history of its own, which must not be appended to.
+    progress_path = os.path.join(store.directory, PROGRESS_FILENAME)
+    archive_path = os.path.abspath(archive_path)
+    if store.next_seq:
+        if not os.path.exists(progress_path):
+            return 0
+        with open(progress_path) as progress_file:
+            if progress_file.read() != archive_path:
+                return 0
+    else:
+        with open(progress_path, 'w') as progress_file:
+            progress_file.write(archive_path)
+
+    # Reads and decompression go to the executor one chunk at a time, the
+    # window keeps drawing while a long archive loads.
+    loop = asyncio.get_running_loop()
+    imported = 0
+    with open(archive_path, 'rb') as archive_file:
+        index, _ = await loop.run_in_executor(
+            None, read_chunk_index, archive_file
+        )
+        skip = store.next_seq - store.first_seq
+        for offset, count, compressed_size in index:
+            if skip >= count:
+                skip -= count
+                continue
+            lines = await loop.run_in_executor(
+                None, read_archive_chunk,
+                archive_file, offset, count, compressed_size
+            )
+            await store.append_raw(lines[skip:])
+            imported += count - skip
+            skip = 0
+
+    os.remove(progress_path)
+    logger.debug('Загружено из архива сообщений: %d', imported)
+    return imported
@@ -1,7 +1,6 @@
 import asyncio
 import json
 import logging
-from tkinter import messagebox
 
 from .chat_reader import read_message
 from .chat_writer import write_message
@@ -22,8 +21,8 @@ async def authorize(reader, writer, token):
     return True, account_data.get('nickname')
 
 
-async def get_access_to_chat(reader, writer, watchdog_queue, token):
-    watchdog_queue.put_nowait('Prompt before auth')
+async def get_access_to_chat(reader, writer, liveness, token):
+    liveness.touch()
     is_authorized, nickname = await authorize(reader, writer, token)
 
     if not is_authorized:
@@ -31,17 +30,15 @@ async def get_access_to_chat(reader, writer, watchdog_queue, token):
             'Неизвестный токен. '
             'Поверьте его или зарегистрируйте заново.'
         )
-        messagebox.showinfo(
+        # Shown by the caller: this may run on the network thread or in a
+        # process without a window.
+        raise InvalidToken(
             'Неверный токен',
             'Поверьте токен, сервер его не узнал.'
         )
-        raise InvalidToken('Your token is invalid')
 
     else:
-        watchdog_queue.put_nowait('Authorization done')
-        logger.debug(
-            'Выполнена авторизация.'
-            f'Пользователь {nickname}.'
-        )
+        liveness.touch()
+        logger.debug('Выполнена авторизация. Пользователь %s.', nickname)
 
     return is_authorized, nickname
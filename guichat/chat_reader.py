@@ -1,11 +1,97 @@
 import asyncio
+import json
 import logging
+import re
+import time
 
 from .log import logger
+from .metrics import metrics
 
 
-async def read_message(reader):
+messages_read = metrics.counter(
+    'chat_messages_read_total', 'Lines read from the chat server.'
+)
+bytes_read = metrics.counter(
+    'chat_bytes_read_total', 'Bytes read from the chat server.'
+)
+decode_time = metrics.histogram(
+    'chat_message_decode_seconds', 'Time to decode lines for the panel.'
+)
+
+NICKNAME = re.compile(r'\[[^\]]*\]\s*([^:]+):')
+
+
+class ChatMessage:
+
+    # One small object per line instead of a string: the panel, the history
+    # writer and the dedup ring all share it, and the bytes from the socket
+    # go to the disk without being decoded and encoded again.
+    # The seq is the number the history store gives the line, it is set
+    # when the line is saved.
+    __slots__ = ('seq', 'received_at', 'raw')
+
+    def __init__(self, seq, received_at, raw):
+        self.seq = seq
+        self.received_at = received_at
+        self.raw = raw
+
+    @property
+    def text(self):
+        # Not kept: the panel copies the text into Tk right away and a
+        # cached copy would double the memory of every queued message.
+        return self.raw.decode(errors='replace')
+
+    @property
+    def nickname(self):
+        match = NICKNAME.match(self.text)
+        if match is None:
+            return None
+        return match.group(1).strip()
+
+    def dumps(self):
+        return json.dumps([
+            self.seq,
+            self.received_at,
+            self.raw.decode(errors='surrogateescape')
+        ])
+
+    @classmethod
+    def loads(cls, line):
+        seq, received_at, text = json.loads(line)
+        return cls(seq, received_at, text.encode(errors='surrogateescape'))
+
+
+async def read_line(reader):
     data = await reader.readline()
-    message = data.decode().rstrip()
+    return data.rstrip()
+
+
+async def read_message(reader):
+    data = await read_line(reader)
+    started_at = time.perf_counter()
+    message = data.decode()
+    decode_time.observe(time.perf_counter() - started_at)
+    messages_read.inc()
+    bytes_read.inc(len(data))
     logger.debug(message)
     return message
+
+
+def decode_messages(messages):
+    # A whole batch is joined and decoded in one go instead of line by line.
+    started_at = time.perf_counter()
+    text = b'\n'.join(message.raw for message in messages).decode(
+        errors='replace'
+    )
+    decode_time.observe(time.perf_counter() - started_at)
+    return text
+
+
+async def read_chat_message(reader):
+    data = await read_line(reader)
+    messages_read.inc()
+    bytes_read.inc(len(data))
+    message = ChatMessage(None, time.time(), data)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message.text)
+    return message
@@ -4,12 +4,24 @@ import logging
 from .log import logger
 
 
-async def write_message(writer, message=None):
+def encode_message(message=None):
     if not message:
-        message = '\n'
-    else:
-        message = message.replace('\n', '').strip()
-        message = f'{message}\n\n'
-    writer.write(message.encode())
-    logger.debug(f'Sent message: {message!r}')
+        return b'\n'
+    message = message.replace('\n', '').strip()
+    return f'{message}\n\n'.encode()
+
+
+async def write_message(writer, message=None):
+    data = encode_message(message)
+    writer.write(data)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'Sent message: {data.decode()!r}')
+    await writer.drain()
+
+
+async def write_messages(writer, messages):
+    data = b''.join(encode_message(message) for message in messages)
+    writer.write(data)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'Sent {len(messages)} messages: {data.decode()!r}')
     await writer.drain()
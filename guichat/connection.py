@@ -1,24 +1,37 @@
 import asyncio
 import contextlib
 import logging
+import random
 import socket
 
+from .framing import open_line_connection
 from .log import logger
 
 
-async def _get_network_streams(host, port, log_file, attempts, timeout):
-    attempts_count = 0
-    reader = None
-    writer = None
-    while not reader:
-        try:
-            reader, writer = await asyncio.open_connection(host, port)
-            success_message = 'Установлено соединение.'
-            logger.debug(success_message)
+class ReconnectPolicy:
+
+    def __init__(self, base_delay=0.5, max_delay=30, multiplier=2, jitter=1):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
 
-            if log_file:
-                await write_message_to_file(success_message, log_file)
+    def delay(self, attempt):
+        # The exponent is capped only to keep the power within float range.
+        delay = self.base_delay * self.multiplier ** min(attempt, 64)
+        delay = min(self.max_delay, delay)
+        # Jitter spreads out the clients that lost the server at the same
+        # moment, so they don't come back in lockstep.
+        return delay * (1 - self.jitter * random.random())
 
+
+async def _get_network_streams(host, port, policy=None):
+    # Without a policy there is a single attempt and the caller decides when
+    # to try again, so that backoff is applied in one place only.
+    attempts_count = 0
+    while True:
+        try:
+            reader, writer = await open_line_connection(host, port)
         except (
             ConnectionRefusedError,
             ConnectionResetError,
@@ -26,43 +39,50 @@ async def _get_network_streams(host, port, log_file, attempts, timeout):
             socket.gaierror,
 
         ):
-
-            if attempts_count < attempts:
-                error_message = 'Нет соединения. Повторная попытка.'
-                logger.debug(error_message)
-
-                if log_file:
-                    await write_message_to_file(error_message, log_file)
-
-                attempts_count += 1
-
-                continue
-
-            else:
-                error_message = (
-                    f'Нет соединения. '
-                    f'Повторная попытка через {timeout} сек.'
-                )
-                logger.debug(error_message)
-
-                if log_file:
-                    await write_message_to_file(error_message, log_file)
-
-                await asyncio.sleep(timeout)
-
-    return reader, writer
+            if policy is None:
+                raise
+            delay = policy.delay(attempts_count)
+            logger.debug(
+                'Нет соединения с %s:%s. Повторная попытка через %.1f сек.',
+                host, port, delay
+            )
+            attempts_count += 1
+            await asyncio.sleep(delay)
+        else:
+            logger.debug('Установлено соединение с %s:%s.', host, port)
+            return reader, writer
 
 
 @contextlib.asynccontextmanager
-async def create_connection(host, port, attempts=1, timeout=5, log_file=None):
-    reader, writer = await _get_network_streams(
-        host,
-        port,
-        log_file,
-        attempts,
-        timeout
-    )
+async def create_connection(host, port, policy=None):
+    reader, writer = await _get_network_streams(host, port, policy)
     try:
         yield reader, writer
     finally:
         writer.close()
+
+
+@contextlib.asynccontextmanager
+async def create_connections(host, ports, policy=None):
+    tasks = [
+        asyncio.ensure_future(
+            _get_network_streams(host, port, policy)
+        )
+        for port in ports
+    ]
+    try:
+        streams = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(BaseException):
+                _, writer = await task
+                writer.close()
+        raise
+
+    try:
+        yield streams
+    finally:
+        for _, writer in streams:
+            writer.close()
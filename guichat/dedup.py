@@ -0,0 +1,55 @@
+import collections
+
+
+DEFAULT_WINDOW = 1000
+
+
+class RecentMessages:
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        # Fingerprints of the last lines in arrival order and how many times
+        # each is in the ring, so memory stays the same however long the
+        # client runs.
+        self._ring = collections.deque()
+        self._counts = {}
+        self.catching_up = False
+        self.dropped = 0
+
+    def remember(self, message):
+        fingerprint = hash(message)
+        self._ring.append(fingerprint)
+        self._counts[fingerprint] = self._counts.get(fingerprint, 0) + 1
+        if len(self._ring) > self.window:
+            oldest = self._ring.popleft()
+            if self._counts[oldest] == 1:
+                del self._counts[oldest]
+            else:
+                self._counts[oldest] -= 1
+
+    def remember_all(self, messages):
+        for message in messages:
+            self.remember(message)
+
+    def resume(self):
+        # The server starts every connection with its recent backlog, which
+        # overlaps with the lines already received.
+        self.catching_up = bool(self._ring)
+
+    def is_new(self, message):
+        if not self.catching_up:
+            self.remember(message)
+            return True
+
+        fingerprint = hash(message)
+        if fingerprint not in self._counts:
+            # The first unseen line ends the backlog, from here on a repeated
+            # line is a new message that merely looks the same.
+            self.catching_up = False
+            self.remember(message)
+            return True
+
+        if fingerprint == self._ring[-1]:
+            self.catching_up = False
+        self.dropped += 1
+        return False
@@ -0,0 +1,71 @@
+from enum import Enum
+
+
+class ReadConnectionStateChanged(Enum):
+    INITIATED = 'устанавливаем соединение'
+    ESTABLISHED = 'соединение установлено'
+    CLOSED = 'соединение закрыто'
+
+    def __str__(self):
+        return str(self.value)
+
+
+class SendingConnectionStateChanged(Enum):
+    INITIATED = 'устанавливаем соединение'
+    ESTABLISHED = 'соединение установлено'
+    CLOSED = 'соединение закрыто'
+
+    def __str__(self):
+        return str(self.value)
+
+
+class NicknameReceived:
+
+    def __init__(self, nickname):
+        self.nickname = nickname
+
+
+class HistoryPageLoaded:
+
+    def __init__(self, lines):
+        self.lines = lines
+
+
+class PreviousPageRequested:
+    pass
+
+
+class HistoryTrimmed:
+
+    def __init__(self, lines_count):
+        self.lines_count = lines_count
+
+
+class HistoryJump:
+
+    def __init__(self, lines, position=None):
+        self.lines = lines
+        self.position = position
+
+
+class SearchRequested:
+
+    def __init__(self, query):
+        self.query = query
+
+
+class SearchResults:
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+
+class JumpRequested:
+
+    def __init__(self, seq):
+        self.seq = seq
+
+
+class LatestRequested:
+    pass
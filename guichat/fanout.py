@@ -0,0 +1,316 @@
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import time
+
+import aionursery
+
+from .chat_reader import ChatMessage
+from .connection import ReconnectPolicy
+from .events import (
+    HistoryJump,
+    HistoryPageLoaded,
+    HistoryTrimmed,
+    JumpRequested,
+    LatestRequested,
+    NicknameReceived,
+    PreviousPageRequested,
+    ReadConnectionStateChanged,
+    SearchRequested,
+    SearchResults,
+    SendingConnectionStateChanged
+)
+from .log import logger
+from .utils import create_handy_nursery
+
+
+CHAT_LINE = b'M'
+EVENT = b'E'
+# History pages and search results go in a single frame.
+FRAME_LIMIT = 64 * 1024 ** 2
+
+STATUS_EVENTS = (
+    ReadConnectionStateChanged,
+    SendingConnectionStateChanged,
+    NicknameReceived
+)
+
+
+class DaemonAlreadyRunning(Exception):
+    pass
+
+
+def is_disconnect(err):
+    # Both directions of a connection may fail at once, the nursery then
+    # raises them together.
+    if isinstance(err, aionursery.MultiError):
+        return all(is_disconnect(error) for error in err.exceptions)
+    return isinstance(err, ConnectionError)
+
+
+def is_chat_frame(frame):
+    return frame.startswith(CHAT_LINE)
+
+
+def pack_event(fields):
+    return EVENT + json.dumps(fields, ensure_ascii=False).encode() + b'\n'
+
+
+def encode_event(event):
+    # A chat line goes to the windows as the very bytes read from the server.
+    if isinstance(event, ChatMessage):
+        return CHAT_LINE + event.raw + b'\n'
+
+    if isinstance(event, str):
+        fields = ['text', event]
+    elif isinstance(event, ReadConnectionStateChanged):
+        fields = ['read', event.name]
+    elif isinstance(event, SendingConnectionStateChanged):
+        fields = ['send', event.name]
+    elif isinstance(event, NicknameReceived):
+        fields = ['nickname', event.nickname]
+    elif isinstance(event, HistoryPageLoaded):
+        fields = ['page', event.lines]
+    elif isinstance(event, HistoryJump):
+        fields = ['jump', event.lines, event.position]
+    elif isinstance(event, SearchResults):
+        fields = ['results', event.results, event.elapsed]
+    else:
+        raise ValueError(f'Unknown event: {event!r}')
+    return pack_event(fields)
+
+
+def decode_event(frame):
+    if is_chat_frame(frame):
+        return ChatMessage(None, time.time(), frame[1:-1])
+
+    kind, *args = json.loads(frame[1:])
+    if kind == 'text':
+        return args[0]
+    if kind == 'read':
+        return ReadConnectionStateChanged[args[0]]
+    if kind == 'send':
+        return SendingConnectionStateChanged[args[0]]
+    if kind == 'nickname':
+        return NicknameReceived(*args)
+    if kind == 'page':
+        return HistoryPageLoaded(*args)
+    if kind == 'jump':
+        return HistoryJump(*args)
+    if kind == 'results':
+        results, elapsed = args
+        return SearchResults([tuple(result) for result in results], elapsed)
+    raise ValueError(f'Unknown event: {kind}')
+
+
+def encode_request(request):
+    if isinstance(request, tuple):
+        _, text = request
+        fields = ['message', text]
+    elif isinstance(request, PreviousPageRequested):
+        fields = ['previous_page']
+    elif isinstance(request, HistoryTrimmed):
+        fields = ['trimmed', request.lines_count]
+    elif isinstance(request, SearchRequested):
+        fields = ['search', request.query]
+    elif isinstance(request, JumpRequested):
+        fields = ['jump_to', request.seq]
+    elif isinstance(request, LatestRequested):
+        fields = ['latest']
+    else:
+        raise ValueError(f'Unknown request: {request!r}')
+    return pack_event(fields)
+
+
+def decode_request(frame):
+    kind, *args = json.loads(frame[1:])
+    if kind == 'message':
+        return (time.monotonic(), *args)
+    if kind == 'previous_page':
+        return PreviousPageRequested()
+    if kind == 'trimmed':
+        return HistoryTrimmed(*args)
+    if kind == 'search':
+        return SearchRequested(*args)
+    if kind == 'jump_to':
+        return JumpRequested(*args)
+    if kind == 'latest':
+        return LatestRequested()
+    raise ValueError(f'Unknown request: {kind}')
+
+
+class Subscribers:
+
+    def __init__(self, replay_size=0):
+        self.queues = set()
+        # The last chat lines, so a window attaching gets those not yet in
+        # the history, and the last status of each kind.
+        self.replay = collections.deque(maxlen=replay_size)
+        self.latest = {}
+        self.departed_dropped = 0
+
+    @property
+    def dropped(self):
+        return self.departed_dropped + sum(
+            queue.dropped for queue in self.queues
+        )
+
+    def qsize(self):
+        return max((queue.qsize() for queue in self.queues), default=0)
+
+    def put_nowait(self, event):
+        # Encoded once, every window is sent the same bytes object.
+        frame = encode_event(event)
+        if isinstance(event, ChatMessage):
+            self.replay.append(frame)
+        elif isinstance(event, STATUS_EVENTS):
+            self.latest[type(event)] = frame
+        for queue in self.queues:
+            queue.put_nowait(frame)
+
+    async def put(self, event):
+        self.put_nowait(event)
+
+    def subscribe(self, queue):
+        for frame in self.latest.values():
+            queue.put_nowait(frame)
+        for frame in self.replay:
+            queue.put_nowait(frame)
+        self.queues.add(queue)
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+        self.departed_dropped += queue.dropped
+
+
+class WindowChannel:
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def put_nowait(self, event):
+        self.frames.put_nowait(encode_event(event))
+
+    async def put(self, event):
+        self.put_nowait(event)
+
+
+async def read_frame(reader):
+    frame = await reader.readline()
+    if not frame:
+        raise ConnectionResetError('Соединение закрыто другой стороной')
+    return frame
+
+
+async def forward_frames(writer, frames, recent=None):
+    while True:
+        frame = await frames.get()
+        # Lines replayed on attach that the history page already holds.
+        if (recent is not None and recent.catching_up
+                and is_chat_frame(frame)
+                and not recent.is_new(frame[1:-1])):
+            continue
+        if writer.is_closing():
+            raise ConnectionResetError('Окно отключилось')
+        writer.write(frame)
+        if frames.empty():
+            await writer.drain()
+
+
+async def read_requests(reader, sending_queue, history_queue, search_queue):
+    while True:
+        request = decode_request(await read_frame(reader))
+        if isinstance(request, tuple):
+            await sending_queue.put(request)
+        elif isinstance(request, (PreviousPageRequested, HistoryTrimmed)):
+            history_queue.put_nowait(request)
+        else:
+            search_queue.put_nowait(request)
+
+
+async def serve_windows(path, serve_window):
+    if os.path.exists(path):
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except ConnectionRefusedError:
+            # Left behind by a daemon that did not exit cleanly.
+            os.remove(path)
+        else:
+            writer.close()
+            raise DaemonAlreadyRunning(path)
+
+    # Whoever can connect writes to the chat as this account, so the socket
+    # is created for the owner only.
+    previous_umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(
+            serve_window, path, limit=FRAME_LIMIT
+        )
+    finally:
+        os.umask(previous_umask)
+    logger.info('Демон чата ждёт окна на %s', path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+async def receive_events(reader, messages_queue, status_queue):
+    while True:
+        event = decode_event(await read_frame(reader))
+        if isinstance(event, STATUS_EVENTS):
+            status_queue.put_nowait(event)
+        else:
+            await messages_queue.put(event)
+
+
+async def forward_requests(writer, queue):
+    while True:
+        writer.write(encode_request(await queue.get()))
+        if queue.empty():
+            await writer.drain()
+
+
+async def attach_to_daemon(
+        path, messages_queue, sending_queue, status_queue,
+        history_queue=None, search_queue=None, policy=None):
+    # The window waits for a daemon that is not running yet or went away,
+    # and attaches again when it is back.
+    policy = policy or ReconnectPolicy()
+    attempt = 0
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(
+                path, limit=FRAME_LIMIT
+            )
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not attempt:
+                logger.error('Демон чата не запущен: %s', path)
+            await asyncio.sleep(policy.delay(attempt))
+            attempt += 1
+            continue
+
+        attempt = 0
+        try:
+            async with create_handy_nursery() as nursery:
+                nursery.start_soon(
+                    receive_events(reader, messages_queue, status_queue)
+                )
+                for queue in (sending_queue, history_queue, search_queue):
+                    if queue is not None:
+                        nursery.start_soon(forward_requests(writer, queue))
+        except (ConnectionError, aionursery.MultiError) as err:
+            if not is_disconnect(err):
+                raise
+            logger.error('Соединение с демоном чата потеряно')
+            status_queue.put_nowait(ReadConnectionStateChanged.CLOSED)
+            status_queue.put_nowait(SendingConnectionStateChanged.CLOSED)
+            continue
+        finally:
+            writer.close()
+
+        break
@@ -0,0 +1,158 @@
+import asyncio
+import collections
+
+
+# The limit of asyncio.StreamReader.readline.
+MAX_LINE_LENGTH = 64 * 1024
+
+
+class LineTooLong(ConnectionError):
+    pass
+
+
+class LineProtocol(asyncio.Protocol):
+
+    def __init__(self, max_lines=1024, max_line_length=MAX_LINE_LENGTH):
+        self.max_lines = max_lines
+        self.max_line_length = max_line_length
+        self.transport = None
+        self._buffer = bytearray()
+        self._lines = collections.deque()
+        self._eof = False
+        self._exception = None
+        self._read_waiter = None
+        self._drain_waiter = None
+        self._paused = False
+        self._reading_paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buffer = self._buffer
+        start = len(buffer)
+        buffer += data
+
+        # Lines are cut from the reusable buffer through a memoryview, so
+        # each one is copied exactly once, straight into its bytes object.
+        end = buffer.find(b'\n', start)
+        if end < 0:
+            if len(buffer) > self.max_line_length:
+                self._drop_long_line()
+            return
+
+        start = 0
+        limit = self.max_line_length
+        with memoryview(buffer) as view:
+            while end >= 0:
+                if end - start > limit:
+                    break
+                self._lines.append(bytes(view[start:end + 1]))
+                start = end + 1
+                end = buffer.find(b'\n', start)
+        del buffer[:start]
+        if end >= 0 or len(buffer) > limit:
+            self._drop_long_line()
+
+        self._wakeup(self._read_waiter)
+        if len(self._lines) >= self.max_lines and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def _drop_long_line(self):
+        # A peer that never sends a line break would grow the buffer without
+        # bound, the connection is dropped instead, as a lost one. The lines
+        # before the long one are still read.
+        self._buffer.clear()
+        self._eof = True
+        self._exception = LineTooLong(
+            f'Line longer than {self.max_line_length} bytes'
+        )
+        self.transport.close()
+        self._wakeup(self._read_waiter)
+
+    def eof_received(self):
+        self._eof = True
+        self._exception = ConnectionResetError('Connection closed by peer')
+        self._wakeup(self._read_waiter)
+
+    def connection_lost(self, exc):
+        self._eof = True
+        if exc is None:
+            exc = self._exception or ConnectionResetError('Connection lost')
+        self._exception = exc
+        self._wakeup(self._read_waiter)
+        self._wakeup(self._drain_waiter, exc)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        self._wakeup(self._drain_waiter)
+
+    def _wakeup(self, waiter, exc=None):
+        if waiter is None or waiter.done():
+            return
+        if exc is None:
+            waiter.set_result(None)
+        else:
+            waiter.set_exception(exc)
+
+    async def readline(self):
+        if self._reading_paused and len(self._lines) <= self.max_lines // 2:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+        while not self._lines and not self._eof:
+            self._read_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._read_waiter
+            finally:
+                self._read_waiter = None
+
+        if self._lines:
+            return self._lines.popleft()
+
+        # The unterminated tail goes first, then the closed connection is
+        # reported instead of returning b'' over and over.
+        tail = bytes(self._buffer)
+        self._buffer.clear()
+        if not tail and self._exception is not None:
+            raise self._exception
+        return tail
+
+    async def drain(self):
+        if self._exception is not None:
+            raise self._exception
+        if not self._paused:
+            return
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._drain_waiter
+        finally:
+            self._drain_waiter = None
+
+
+class LineWriter:
+
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self._protocol = protocol
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        await self._protocol.drain()
+
+    def close(self):
+        self.transport.close()
+
+
+async def open_line_connection(host, port, max_lines=1024):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_connection(
+        lambda: LineProtocol(max_lines), host, port
+    )
+    return protocol, LineWriter(transport, protocol)
@@ -1,45 +1,65 @@
+import _tkinter
 import tkinter as tk
 import asyncio
+import time
 from tkinter.scrolledtext import ScrolledText
-from enum import Enum
 
+from async_timeout import timeout
+
+from guichat.chat_reader import ChatMessage, decode_messages
+from guichat.events import (
+    HistoryJump,
+    HistoryPageLoaded,
+    HistoryTrimmed,
+    JumpRequested,
+    LatestRequested,
+    NicknameReceived,
+    PreviousPageRequested,
+    ReadConnectionStateChanged,
+    SearchRequested,
+    SearchResults,
+    SendingConnectionStateChanged
+)
+from guichat.highlight import Highlighter
+from guichat.metrics import metrics, SIZE_BUCKETS
+from guichat.queues import ThreadWatermarkChannel, WatermarkQueue
 from guichat.utils import create_handy_nursery
 
 
-class TkAppClosed(Exception):
-    pass
-
-
-class ReadConnectionStateChanged(Enum):
-    INITIATED = 'устанавливаем соединение'
-    ESTABLISHED = 'соединение установлено'
-    CLOSED = 'соединение закрыто'
-
-    def __str__(self):
-        return str(self.value)
+TK_LOOPS = ('polling', 'adaptive')
 
 
-class SendingConnectionStateChanged(Enum):
-    INITIATED = 'устанавливаем соединение'
-    ESTABLISHED = 'соединение установлено'
-    CLOSED = 'соединение закрыто'
+render_time = metrics.histogram(
+    'chat_render_batch_seconds', 'Time to draw one batch of messages.'
+)
+render_batch_size = metrics.histogram(
+    'chat_render_batch_messages', 'Messages drawn in one batch.', SIZE_BUCKETS
+)
 
-    def __str__(self):
-        return str(self.value)
 
-
-class NicknameReceived:
-
-    def __init__(self, nickname):
-        self.nickname = nickname
+class TkAppClosed(Exception):
+    pass
 
 
 def process_new_message(input_field, sending_queue):
+    if input_field['state'] == 'disabled':
+        return
     text = input_field.get()
-    sending_queue.put_nowait(text)
+    sending_queue.put_nowait((time.monotonic(), text))
     input_field.delete(0, tk.END)
 
 
+async def watch_sending_backpressure(input_widgets, sending_queue):
+    while True:
+        await sending_queue.blocked.wait()
+        for widget in input_widgets:
+            widget['state'] = 'disabled'
+
+        await sending_queue.writable.wait()
+        for widget in input_widgets:
+            widget['state'] = 'normal'
+
+
 async def update_tk(root_frame, interval=1 / 120):
     while True:
         try:
@@ -50,25 +70,312 @@ async def update_tk(root_frame, interval=1 / 120):
         await asyncio.sleep(interval)
 
 
-async def update_conversation_history(panel, messages_queue):
-    panel.yview(tk.END)
-
+async def update_tk_adaptive(
+        root_frame, wakeup, min_interval=1 / 120, max_interval=1 / 20):
+    interval = min_interval
     while True:
-        msg = await messages_queue.get()
+        has_events = False
+        try:
+            while root_frame.tk.dooneevent(_tkinter.DONT_WAIT):
+                has_events = True
+            root_frame.update_idletasks()
+        except tk.TclError:
+            # if application has been destroyed/closed
+            raise TkAppClosed()
 
-        panel['state'] = 'normal'
-        if panel.index('end-1c') != '1.0':
-            panel.insert('end', '\n')
-        panel.insert('end', msg)
+        # Poll at full rate while the user or the chat is active and back off
+        # exponentially when idle. Widget updates from coroutines set wakeup,
+        # so they are drawn without waiting for the next poll.
+        if has_events or wakeup.is_set():
+            interval = min_interval
+        else:
+            interval = min(interval * 2, max_interval)
 
-        _, y = panel.vbar.get()
-        if y == 1.0:
-            panel.yview(tk.END)
+        wakeup.clear()
+        try:
+            async with timeout(interval):
+                await wakeup.wait()
+        except asyncio.TimeoutError:
+            pass
+
+
+def run_tk_loop(root_frame, tk_loop='polling', wakeup=None):
+    if tk_loop not in TK_LOOPS:
+        raise ValueError(f'Unknown Tk loop: {tk_loop}')
+
+    if tk_loop == 'adaptive':
+        return update_tk_adaptive(root_frame, wakeup or asyncio.Event())
+    return update_tk(root_frame)
+
+
+def watch_scroll_top(panel, history_queue, page_state):
+    def on_scroll(first, last):
+        panel.vbar.set(first, last)
+        if page_state['pending'] or page_state['exhausted']:
+            return
+        # Ask for an older page only when the user has scrolled up to the
+        # very top of a panel that actually overflows.
+        if float(first) == 0.0 and float(last) < 1.0:
+            page_state['pending'] = True
+            history_queue.put_nowait(PreviousPageRequested())
+
+    panel['yscrollcommand'] = on_scroll
+
+
+def prepend_history_page(panel, lines, page_state, highlighter=None):
+    page_state['pending'] = False
+    if not lines:
+        # Nothing older is left until the panel is trimmed or jumps to
+        # another place in the history.
+        page_state['exhausted'] = True
+        return
+
+    panel['state'] = 'normal'
+    panel.insert('1.0', '\n'.join(lines) + '\n')
+    if highlighter is not None:
+        highlighter.highlight(lines, 1)
+    panel.yview(f'{len(lines) + 1}.0')
+    panel['state'] = 'disabled'
+
+
+def append_messages(panel, messages, highlighter=None):
+    text = '\n'.join(messages)
+
+    panel['state'] = 'normal'
+    empty = panel.index('end-1c') == '1.0'
+    panel.insert('end', text if empty else f'\n{text}')
+    if highlighter is not None:
+        # Counted back from the line the panel ends on, so the ranges land
+        # on the lines the panel has made of the text, line breaks inside
+        # a message included.
+        lines = text.split('\n')
+        last_line = int(panel.index('end-1c').split('.')[0])
+        highlighter.highlight(lines, last_line - len(lines) + 1)
+
+    _, y = panel.vbar.get()
+    if y == 1.0:
+        panel.yview(tk.END)
+
+    panel['state'] = 'disabled'
+
+
+def show_latest_button(search_panel, detached):
+    if search_panel is None:
+        return
+    *_, latest_button, _ = search_panel
+    if detached:
+        latest_button.pack(side="left")
+    else:
+        latest_button.pack_forget()
+
+
+def trim_newest_lines(panel, lines_count, excess, page_state, search_panel):
+    # Only the lines below the viewport go, never the ones being read.
+    last_visible = int(
+        panel.index(f'@0,{panel.winfo_height()}').split('.')[0]
+    )
+    keep_lines = max(lines_count - excess, last_visible)
+    if keep_lines >= lines_count:
+        return
+
+    panel['state'] = 'normal'
+    panel.delete(f'{keep_lines}.0 lineend', 'end')
+    panel['state'] = 'disabled'
+
+    # The panel no longer ends with the latest message, new ones only go
+    # to the history until the latest button brings the panel back.
+    page_state['detached'] = True
+    show_latest_button(search_panel, True)
+
+
+def trim_scrollback(
+        panel, max_lines, history_queue, page_state, search_panel=None):
+    lines_count = int(panel.index('end-1c').split('.')[0])
+
+    # Trim in bulk once the cap is exceeded by a tenth, not on every insert.
+    if lines_count <= max_lines + max_lines // 10:
+        return
+
+    excess = lines_count - max_lines
+    _, y = panel.vbar.get()
+    if y != 1.0:
+        # The user is reading older messages, so the newest ones are
+        # dropped instead. Without the latest button they could not be
+        # brought back, and the panel is left as it is.
+        if search_panel is not None:
+            trim_newest_lines(
+                panel, lines_count, excess, page_state, search_panel
+            )
+        return
+
+    panel['state'] = 'normal'
+    panel.delete('1.0', f'{excess + 1}.0')
+    panel['state'] = 'disabled'
+    panel.yview(tk.END)
 
-        panel['state'] = 'disabled'
+    page_state['pending'] = False
+    page_state['exhausted'] = False
+    if history_queue is not None:
+        history_queue.put_nowait(HistoryTrimmed(excess))
+
+
+def show_history_jump(
+        panel, jump, page_state, search_panel=None, highlighter=None):
+    panel['state'] = 'normal'
+    panel.delete('1.0', 'end')
+    panel.insert('1.0', '\n'.join(jump.lines))
+    if highlighter is not None:
+        highlighter.highlight(jump.lines, 1)
+    if jump.position is None:
+        panel.yview(tk.END)
+    else:
+        line = f'{jump.position + 1}.0'
+        panel.tag_add('search_hit', line, f'{line} lineend')
+        panel.see(line)
+    panel['state'] = 'disabled'
+
+    # While the panel shows a page found by search, new messages only go
+    # to the history, the latest button brings the panel back to them.
+    page_state['pending'] = False
+    page_state['exhausted'] = False
+    page_state['detached'] = jump.position is not None
+    show_latest_button(search_panel, page_state['detached'])
+
+
+def show_search_results(panel, found, search_panel):
+    results_frame, summary_label, results_list, _, result_seqs = search_panel
+
+    result_seqs[:] = [seq for seq, _ in found.results]
+    results_list.delete(0, tk.END)
+    for _, line in found.results:
+        results_list.insert(tk.END, line)
+
+    summary_label['text'] = (
+        f'Найдено: {len(found.results)} за {found.elapsed * 1000:.1f} мс'
+    )
+    if not results_frame.winfo_manager():
+        results_frame.pack(side="top", fill=tk.X, before=panel.frame)
+
+
+def append_to_panel(panel, messages, page_state, highlighter=None):
+    if not messages or page_state.get('detached'):
+        return
+    append_messages(panel, messages, highlighter)
+    if page_state.get('resync') is not None:
+        page_state['resync'].extend('\n'.join(messages).split('\n'))
+
+
+def finish_resync(panel, tail, page_state, highlighter=None):
+    # Lines drawn while the tail was being read are either at its end or
+    # not saved yet, the latter are put back after it.
+    drawn = page_state['resync']
+    page_state['resync'] = None
+    overlap = min(len(drawn), len(tail))
+    while overlap and tail[-overlap:] != drawn[:overlap]:
+        overlap -= 1
+    append_to_panel(panel, drawn[overlap:], page_state, highlighter)
+
+
+def render_batch(
+        panel, batch, page_state, search_panel=None, highlighter=None):
+    messages = []
+    received = []
+    for msg in batch:
+        if isinstance(msg, ChatMessage):
+            received.append(msg)
+            continue
+        if received:
+            messages.append(decode_messages(received))
+            received = []
+        if isinstance(msg, str):
+            messages.append(msg)
+            continue
+
+        append_to_panel(panel, messages, page_state, highlighter)
+        messages = []
+
+        if isinstance(msg, HistoryPageLoaded):
+            prepend_history_page(panel, msg.lines, page_state, highlighter)
+        elif isinstance(msg, HistoryJump):
+            show_history_jump(
+                panel, msg, page_state, search_panel, highlighter
+            )
+            if msg.position is None and page_state['resync'] is not None:
+                finish_resync(panel, msg.lines, page_state, highlighter)
+        elif isinstance(msg, SearchResults) and search_panel is not None:
+            show_search_results(panel, msg, search_panel)
+
+    if received:
+        messages.append(decode_messages(received))
+    append_to_panel(panel, messages, page_state, highlighter)
+
+
+def request_resync(messages_queue, history_queue, page_state, dropped_seen):
+    # Lines dropped from a full queue leave holes in the panel, and its
+    # line counts no longer match the history cursor. Once the backlog is
+    # drawn, the panel is reloaded from the history.
+    dropped = getattr(messages_queue, 'dropped', 0)
+    if dropped == dropped_seen or history_queue is None:
+        return dropped_seen
+    if page_state['resync'] is not None or not messages_queue.empty():
+        return dropped_seen
+    if not page_state['detached']:
+        page_state['resync'] = []
+        history_queue.put_nowait(LatestRequested())
+    return dropped
+
+
+async def update_conversation_history(
+        panel, messages_queue, history_queue=None, max_batch=1000,
+        frame_budget=1 / 60, scrollback_lines=None, tk_wakeup=None,
+        search_panel=None, highlighter=None):
+    panel.yview(tk.END)
 
+    page_state = {
+        'pending': False, 'exhausted': False, 'detached': False,
+        'resync': None
+    }
+    dropped_seen = getattr(messages_queue, 'dropped', 0)
+    if history_queue is not None:
+        watch_scroll_top(panel, history_queue, page_state)
 
-async def update_status_panel(status_labels, status_updates_queue):
+    batch_limit = max_batch
+    while True:
+        batch = [await messages_queue.get()]
+        while len(batch) < batch_limit and not messages_queue.empty():
+            batch.append(messages_queue.get_nowait())
+
+        started_at = time.perf_counter()
+        render_batch(panel, batch, page_state, search_panel, highlighter)
+        if scrollback_lines:
+            trim_scrollback(
+                panel, scrollback_lines, history_queue, page_state,
+                search_panel
+            )
+        dropped_seen = request_resync(
+            messages_queue, history_queue, page_state, dropped_seen
+        )
+        elapsed = time.perf_counter() - started_at
+        render_time.observe(elapsed)
+        render_batch_size.observe(len(batch))
+        if tk_wakeup is not None:
+            tk_wakeup.set()
+
+        # Keep a single frame within budget: shrink the batch after a slow
+        # insert, grow it back while inserts are cheap.
+        if elapsed > frame_budget:
+            batch_limit = max(batch_limit // 2, 1)
+        elif elapsed < frame_budget / 2:
+            batch_limit = min(batch_limit * 2, max_batch)
+
+        if not messages_queue.empty():
+            # Let update_tk process input before the next chunk of backlog.
+            await asyncio.sleep(frame_budget)
+
+
+async def update_status_panel(
+        status_labels, status_updates_queue, tk_wakeup=None,
+        highlighter=None):
     nickname_label, read_label, write_label = status_labels
 
     read_label['text'] = f'Чтение: нет соединения'
@@ -85,6 +392,12 @@ async def update_status_panel(status_labels, status_updates_queue):
 
         if isinstance(msg, NicknameReceived):
             nickname_label['text'] = f'Имя пользователя: {msg.nickname}'
+            if highlighter is not None:
+                # Mentions are looked for in the messages that come next.
+                highlighter.set_nickname(msg.nickname)
+
+        if tk_wakeup is not None:
+            tk_wakeup.set()
 
 
 def create_status_panel(root_frame):
@@ -109,7 +422,57 @@ def create_status_panel(root_frame):
     return (nickname_label, status_read_label, status_write_label)
 
 
-async def draw(messages_queue, sending_queue, status_updates_queue):
+def create_search_panel(root_frame, search_queue):
+    search_frame = tk.Frame(root_frame)
+    search_frame.pack(side="top", fill=tk.X)
+
+    query_field = tk.Entry(search_frame)
+    query_field.pack(side="left", fill=tk.X, expand=True)
+
+    search_button = tk.Button(search_frame)
+    search_button["text"] = "Найти"
+    search_button.pack(side="left")
+
+    latest_button = tk.Button(search_frame)
+    latest_button["text"] = "К новым сообщениям"
+    latest_button["command"] = lambda: search_queue.put_nowait(
+        LatestRequested())
+
+    results_frame = tk.Frame(root_frame)
+    summary_label = tk.Label(
+        results_frame, height=1, fg='grey', font='arial 10', anchor='w')
+    summary_label.pack(side="top", fill=tk.X)
+    results_list = tk.Listbox(results_frame, height=8)
+    results_list.pack(side="top", fill=tk.X)
+    result_seqs = []
+
+    def search(event=None):
+        search_queue.put_nowait(SearchRequested(query_field.get()))
+
+    def close_results(event=None):
+        query_field.delete(0, tk.END)
+        results_frame.pack_forget()
+
+    def jump(event=None):
+        selection = results_list.curselection()
+        if selection:
+            search_queue.put_nowait(JumpRequested(result_seqs[selection[0]]))
+
+    query_field.bind("<Return>", search)
+    query_field.bind("<Escape>", close_results)
+    search_button["command"] = search
+    results_list.bind("<Double-Button-1>", jump)
+    results_list.bind("<Return>", jump)
+
+    return (
+        results_frame, summary_label, results_list, latest_button, result_seqs
+    )
+
+
+async def draw(
+        messages_queue, sending_queue, status_updates_queue,
+        history_queue=None, scrollback_lines=None, tk_loop='polling',
+        painted=None, search_queue=None):
     root = tk.Tk()
 
     root.title('Чат Майнкрафтера')
@@ -119,6 +482,10 @@ async def draw(messages_queue, sending_queue, status_updates_queue):
 
     status_labels = create_status_panel(root_frame)
 
+    search_panel = None
+    if search_queue is not None:
+        search_panel = create_search_panel(root_frame, search_queue)
+
     input_frame = tk.Frame(root_frame)
     input_frame.pack(side="bottom", fill=tk.X)
 
@@ -136,14 +503,51 @@ async def draw(messages_queue, sending_queue, status_updates_queue):
 
     conversation_panel = ScrolledText(root_frame, wrap='none')
     conversation_panel.pack(side="top", fill="both", expand=True)
+    highlighter = Highlighter(conversation_panel)
+    conversation_panel.tag_configure('search_hit', background='yellow')
+    # A search hit is drawn over a mention, both set the background.
+    conversation_panel.tag_raise('search_hit', 'mention')
+
+    # Map and draw the window right away, the caller waits for it before
+    # loading the rest of the application.
+    try:
+        root.update()
+    except tk.TclError:
+        raise TkAppClosed()
+    if painted is not None:
+        painted.set()
+
+    tk_wakeup = asyncio.Event()
 
     async with create_handy_nursery() as nursery:
-        nursery.start_soon(update_tk(root_frame))
+        nursery.start_soon(run_tk_loop(root_frame, tk_loop, tk_wakeup))
 
         nursery.start_soon(
-            update_conversation_history(conversation_panel, messages_queue)
+            update_conversation_history(
+                conversation_panel,
+                messages_queue,
+                history_queue,
+                scrollback_lines=scrollback_lines,
+                tk_wakeup=tk_wakeup,
+                search_panel=search_panel,
+                highlighter=highlighter
+            )
         )
 
         nursery.start_soon(
-            update_status_panel(status_labels, status_updates_queue)
+            update_status_panel(
+                status_labels,
+                status_updates_queue,
+                tk_wakeup,
+                highlighter
+            )
         )
+
+        if isinstance(
+                sending_queue, (WatermarkQueue, ThreadWatermarkChannel)):
+            nursery.start_soon(
+                watch_sending_backpressure(
+                    (input_field, send_button),
+                    sending_queue
+                )
+            )
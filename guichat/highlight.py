@@ -0,0 +1,76 @@
+import collections
+import functools
+import re
+import zlib
+
+
+NICKNAME_COLORS = (
+    '#c0392b', '#2471a3', '#1e8449', '#7d3c98', '#ca6f1e', '#138d75',
+    '#a04000', '#2e4053', '#b03a2e', '#1a5276', '#0e6655', '#6c3483',
+)
+TIMESTAMP_COLOR = 'grey'
+MENTION_BACKGROUND = '#fff3b0'
+
+HEADER = re.compile(r'(\[[^\]]*\])\s*([^:\n]+):')
+
+
+@functools.lru_cache(maxsize=64)
+def compile_pattern(pattern):
+    return re.compile(pattern)
+
+
+@functools.lru_cache(maxsize=4096)
+def nickname_tag(nickname):
+    # A fixed palette keeps the number of Tk tags small however many people
+    # write to the chat, crc32 gives a sender the same color in every run.
+    color = zlib.crc32(nickname.encode()) % len(NICKNAME_COLORS)
+    return f'nickname{color}'
+
+
+def mention_pattern(nickname):
+    return compile_pattern(rf'(?<!\w)@?{re.escape(nickname)}(?!\w)')
+
+
+class Highlighter:
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.mention = None
+        panel.tag_configure('timestamp', foreground=TIMESTAMP_COLOR)
+        for number, color in enumerate(NICKNAME_COLORS):
+            panel.tag_configure(f'nickname{number}', foreground=color)
+        panel.tag_configure('mention', background=MENTION_BACKGROUND)
+        # Above the nickname colors whatever order the tags were created in.
+        panel.tag_raise('mention')
+
+    def set_nickname(self, nickname):
+        self.mention = mention_pattern(nickname) if nickname else None
+
+    def find_ranges(self, lines, first_line):
+        ranges = collections.defaultdict(list)
+        for number, line in enumerate(lines, first_line):
+            header = HEADER.match(line)
+            if header is None:
+                continue
+            ranges['timestamp'] += (
+                f'{number}.{header.start(1)}', f'{number}.{header.end(1)}'
+            )
+            nickname = header.group(2).rstrip()
+            ranges[nickname_tag(nickname)] += (
+                f'{number}.{header.start(2)}',
+                f'{number}.{header.start(2) + len(nickname)}'
+            )
+            if self.mention is None:
+                continue
+            for mention in self.mention.finditer(line, header.end()):
+                ranges['mention'] += (
+                    f'{number}.{mention.start()}', f'{number}.{mention.end()}'
+                )
+        return ranges
+
+    def highlight(self, lines, first_line):
+        # Only the lines just inserted are matched, and every tag gets all
+        # of its ranges in one Tk call, so a message costs the same however
+        # much text the panel already holds.
+        for tag, indices in self.find_ranges(lines, first_line).items():
+            self.panel.tag_add(tag, *indices)
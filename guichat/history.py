@@ -0,0 +1,88 @@
+import asyncio
+
+from async_timeout import timeout
+
+from .metrics import metrics
+
+
+write_latency = metrics.histogram(
+    'chat_history_write_seconds', 'Time to write one batch to the history.'
+)
+messages_saved = metrics.counter(
+    'chat_history_messages_saved_total', 'Messages written to the history.'
+)
+
+
+class ChatHistory:
+
+    def __init__(self, store, page_size=1000):
+        self.store = store
+        self.page_size = page_size
+        self.first_seq = None
+
+    async def read_tail(self):
+        end_seq = self.store.next_seq
+        self.first_seq = max(end_seq - self.page_size, self.store.first_seq)
+        return self.store.read(self.first_seq, end_seq - self.first_seq)
+
+    async def read_around(self, seq):
+        self.first_seq = max(seq - self.page_size // 2, self.store.first_seq)
+        lines = self.store.read(self.first_seq, self.page_size)
+        return lines, seq - self.first_seq
+
+    def forget(self, lines_count):
+        if self.first_seq is not None:
+            self.first_seq = min(
+                self.first_seq + lines_count, self.store.next_seq
+            )
+
+    async def read_previous_page(self):
+        if self.first_seq is None or self.first_seq <= self.store.first_seq:
+            return []
+
+        end_seq = self.first_seq
+        self.first_seq = max(end_seq - self.page_size, self.store.first_seq)
+        return self.store.read(self.first_seq, end_seq - self.first_seq)
+
+
+async def flush_messages(store, batch, fsync):
+    if not batch:
+        return
+    messages = batch[:]
+    batch.clear()
+    with write_latency.time():
+        await store.append_messages(messages)
+        if fsync:
+            await store.fsync()
+    messages_saved.inc(len(messages))
+
+
+async def save_messages(
+        store, save_queue, max_messages=1000, max_bytes=1024 * 1024,
+        max_latency=0.05, fsync=False):
+
+    batch = []
+    try:
+        while True:
+            message = await save_queue.get()
+            batch.append(message)
+            batch_size = len(message.raw)
+
+            try:
+                async with timeout(max_latency):
+                    while (len(batch) < max_messages
+                           and batch_size < max_bytes):
+                        message = await save_queue.get()
+                        batch.append(message)
+                        batch_size += len(message.raw)
+            except asyncio.TimeoutError:
+                pass
+
+            await flush_messages(store, batch, fsync)
+
+    finally:
+        # Whatever was received must reach the disk even when the nursery
+        # is being torn down, so drain the queue without waiting for more.
+        while not save_queue.empty():
+            batch.append(save_queue.get_nowait())
+        await flush_messages(store, batch, fsync)
@@ -1,5 +1,70 @@
+import contextlib
 import logging
+import logging.handlers
+import queue
 
 
 logger = logging.getLogger(__package__)
 logger.addHandler(logging.NullHandler())
+
+EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # The arguments and the exception may change once the logging call
+        # returns, so they are rendered here. Adding the time, the level and
+        # the rest of the format is left to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = EXCEPTION_FORMATTER.formatException(
+                record.exc_info
+            )
+        return record
+
+
+@contextlib.contextmanager
+def queued_logging(log_file=None, log_format='%(message)s', level=None,
+                   stderr=True):
+    # The event loop only puts records on a queue, a background thread
+    # formats them and writes to stderr and the log file.
+    handlers = [logging.StreamHandler()] if stderr else []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    formatter = logging.Formatter(log_format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Only the fields the format uses are collected when a record is made.
+    collected = {
+        'logThreads': '%(thread' in log_format,
+        'logProcesses': '%(process' in log_format,
+        'logMultiprocessing': '%(processName' in log_format,
+    }
+    previous_collected = {name: getattr(logging, name) for name in collected}
+    for name, value in collected.items():
+        setattr(logging, name, value)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        records, *handlers, respect_handler_level=True
+    )
+    root = logging.getLogger()
+    previous_handlers = root.handlers[:]
+    root.handlers = [DeferredQueueHandler(records)]
+    if level is not None:
+        root.setLevel(level)
+
+    listener.start()
+    try:
+        yield listener
+    finally:
+        # Stopping the listener writes out whatever is still queued.
+        listener.stop()
+        root.handlers = previous_handlers
+        for name, value in previous_collected.items():
+            setattr(logging, name, value)
+        for handler in handlers:
+            handler.close()
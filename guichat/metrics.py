@@ -0,0 +1,282 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .log import logger
+
+
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5
+)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000)
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, description, read=None):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.read = read
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.snapshot()
+
+    def snapshot(self):
+        return self.read() if self.read is not None else self.value
+
+
+class Gauge:
+
+    kind = 'gauge'
+
+    def __init__(self, name, description, read=None):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.read = read
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, self.snapshot()
+
+    def snapshot(self):
+        return self.read() if self.read is not None else self.value
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at)
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else repr(bound)
+            yield f'{self.name}_bucket{{le="{le}"}}', cumulative
+        yield f'{self.name}_sum', self.sum
+        yield f'{self.name}_count', self.count
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip(map(str, self.buckets), self.counts)),
+            'overflow': self.counts[-1],
+        }
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        # Modules create their metrics on import, a second import or a
+        # benchmark running several clients shares the same objects.
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, read=None):
+        counter = self._register(Counter(name, description))
+        if read is not None:
+            counter.read = read
+        return counter
+
+    def gauge(self, name, description, read=None):
+        gauge = self._register(Gauge(name, description))
+        if read is not None:
+            gauge.read = read
+        return gauge
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, description, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, value in metric.samples():
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def render_json(self):
+        return json.dumps({
+            'timestamp': time.time(),
+            'metrics': {
+                name: metric.snapshot()
+                for name, metric in self.metrics.items()
+            },
+        })
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        # Samples the thread that starts the profiler, i.e. the event loop.
+        target_id = threading.get_ident()
+        self.stacks.clear()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(target_id,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return ''
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        return self.collapsed()
+
+    def _sample(self, target_id):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(target_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f'{filename}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        # The collapsed stacks format read by flamegraph.pl and speedscope.
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+def toggle_profiler(profiler, filepath):
+    if not profiler.running:
+        profiler.start()
+        logger.info('Профилирование запущено')
+        return
+
+    with open(filepath, 'w') as profile_file:
+        profile_file.write(profiler.stop())
+    logger.info(f'Профилирование остановлено, результат в {filepath}')
+
+
+async def write_response(writer, status, body, content_type='text/plain'):
+    body = body.encode()
+    writer.write(
+        f'HTTP/1.0 {status}\r\n'
+        f'Content-Type: {content_type}; charset=utf-8\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+
+
+async def handle_metrics_request(registry, profiler, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode()
+        while (await reader.readline()).strip():
+            pass
+
+        _, target, *_ = request_line.split() or ['', '']
+        url = urlsplit(target)
+        if url.path == '/metrics':
+            await write_response(
+                writer, '200 OK', registry.render_prometheus(),
+                'text/plain; version=0.0.4'
+            )
+        elif url.path == '/metrics.json':
+            await write_response(
+                writer, '200 OK', registry.render_json(), 'application/json'
+            )
+        elif url.path == '/profile':
+            if profiler.running:
+                await write_response(
+                    writer, '409 Conflict', 'Profiler is already running\n'
+                )
+                return
+            seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stacks = profiler.stop()
+            await write_response(writer, '200 OK', stacks)
+        else:
+            await write_response(writer, '404 Not Found', 'Not found\n')
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(registry, profiler, host, port):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_metrics_request(
+            registry, profiler, reader, writer
+        ),
+        host, port
+    )
+    logger.info(f'Метрики доступны на http://{host}:{port}/metrics')
+    async with server:
+        await server.serve_forever()
+
+
+async def dump_metrics(registry, filepath, interval=10):
+    while True:
+        await asyncio.sleep(interval)
+        # Written next to the target and renamed, so a reader never sees a
+        # half-written file.
+        tmp_path = f'{filepath}.tmp'
+        with open(tmp_path, 'w') as dump_file:
+            dump_file.write(registry.render_json())
+        os.replace(tmp_path, filepath)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import json
+import os
+
+
+class WatermarkQueue(asyncio.Queue):
+
+    def __init__(self, high_water=100, low_water=10):
+        super().__init__()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.writable = asyncio.Event()
+        self.blocked = asyncio.Event()
+        self.writable.set()
+
+    def _put(self, item):
+        super()._put(item)
+        if self.qsize() >= self.high_water and self.writable.is_set():
+            self.writable.clear()
+            self.blocked.set()
+
+    def _get(self):
+        item = super()._get()
+        if self.qsize() <= self.low_water and self.blocked.is_set():
+            self.blocked.clear()
+            self.writable.set()
+        return item
+
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest', 'coalesce')
+
+
+class BoundedQueue(asyncio.Queue):
+
+    def __init__(
+            self, maxsize=0, overflow='block', droppable=None,
+            coalesce_key=type):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {overflow}')
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.droppable = droppable or (lambda item: True)
+        self.coalesce_key = coalesce_key
+        self.dropped = 0
+
+    async def put(self, item):
+        if self.overflow == 'block':
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item):
+        if self.overflow == 'block' or not self.full():
+            super().put_nowait(item)
+            return
+
+        if not self.droppable(item):
+            # Page replies and other events are never lost, the queue goes
+            # over its size for them instead.
+            self._put_over_size(item)
+            return
+
+        if self.overflow == 'coalesce':
+            # A newer item of the same kind supersedes the queued one.
+            key = self.coalesce_key(item)
+            if self._remove_first(lambda queued: (
+                    self.droppable(queued)
+                    and self.coalesce_key(queued) == key)):
+                self.dropped += 1
+                self._put_over_size(item)
+                return
+
+        # With coalesce and nothing of the same kind queued, the new item
+        # goes rather than an unrelated one.
+        keep_queued = self.overflow in ('drop-newest', 'coalesce')
+        if keep_queued or not self._remove_first(self.droppable):
+            self.dropped += 1
+            return
+
+        self.dropped += 1
+        # Events kept over the size may still fill the queue.
+        self._put_over_size(item)
+
+    def _put_over_size(self, item):
+        self._put(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+
+    def _remove_first(self, predicate):
+        for position, queued in enumerate(self._queue):
+            if predicate(queued):
+                del self._queue[position]
+                self.task_done()
+                return True
+        return False
+
+
+class SpillQueue(asyncio.Queue):
+
+    def __init__(self, capacity, spill_path, dumps=json.dumps,
+                 loads=json.loads):
+        super().__init__()
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.dumps = dumps
+        self.loads = loads
+        self.spilled = 0
+        self.spilled_total = 0
+        self._spill_writer = None
+        self._spill_reader = None
+
+        # Items left in the file by a crashed client go first, they are
+        # older than anything received now.
+        if os.path.exists(spill_path):
+            self._open_spill_file()
+            self.spilled = sum(1 for _ in self._spill_reader)
+            self._spill_reader.seek(0)
+
+    def qsize(self):
+        return len(self._queue) + self.spilled
+
+    def empty(self):
+        return not self.qsize()
+
+    def _open_spill_file(self):
+        self._spill_writer = open(self.spill_path, 'a', encoding='utf-8')
+        self._spill_reader = open(self.spill_path, encoding='utf-8')
+
+    def _put(self, item):
+        # Once something is spilled, newer items follow it into the file,
+        # otherwise they would overtake it.
+        if not self.spilled and len(self._queue) < self.capacity:
+            self._queue.append(item)
+            return
+
+        if self._spill_writer is None:
+            self._open_spill_file()
+        self._spill_writer.write(self.dumps(item) + '\n')
+        self.spilled += 1
+        self.spilled_total += 1
+
+    def _get(self):
+        if not self._queue:
+            self._unspill()
+        return self._queue.popleft()
+
+    def _unspill(self):
+        self._spill_writer.flush()
+        count = min(self.spilled, self.capacity)
+        for _ in range(count):
+            self._queue.append(self.loads(self._spill_reader.readline()))
+        self.spilled -= count
+
+        if not self.spilled:
+            self._spill_writer.seek(0)
+            self._spill_writer.truncate()
+            self._spill_reader.seek(0)
+
+    def close(self):
+        if self._spill_writer is None:
+            return
+        self._spill_writer.close()
+        self._spill_reader.close()
+        self._spill_writer = self._spill_reader = None
+        if not self.spilled:
+            os.remove(self.spill_path)
+
+
+class ThreadChannel:
+
+    def __init__(self, maxsize=0, droppable=None):
+        self.maxsize = maxsize
+        self.droppable = droppable or (lambda item: True)
+        self.dropped = 0
+        self._items = collections.deque()
+        self._ready = None
+        self._loop = None
+        self._wakeup_scheduled = False
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def put_nowait(self, item):
+        # Any thread may put: deque appends and pops are atomic, so the only
+        # cross-thread call is one consumer wakeup per burst of items.
+        items = self._items
+        # Removing a queued item would race with the consumer, so a full
+        # channel drops the new item, and only if it may be dropped: page
+        # replies and other events always go through.
+        if self.maxsize and len(items) >= self.maxsize:
+            if self.droppable(item):
+                self.dropped += 1
+                return
+        items.append(item)
+
+        if self._loop is not None and not self._wakeup_scheduled:
+            self._wakeup_scheduled = True
+            self._loop.call_soon_threadsafe(self._wakeup)
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def _wakeup(self):
+        self._wakeup_scheduled = False
+        self._ready.set()
+
+    def _pop(self):
+        return self._items.popleft()
+
+    def get_nowait(self):
+        try:
+            return self._pop()
+        except IndexError:
+            raise asyncio.QueueEmpty()
+
+    async def get(self):
+        if self._loop is None:
+            self._ready = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._pop()
+
+
+class ThreadWatermarkChannel(ThreadChannel):
+
+    def __init__(self, high_water=100, low_water=10):
+        super().__init__()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.writable = asyncio.Event()
+        self.blocked = asyncio.Event()
+        self.writable.set()
+        self._producer_loop = None
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        # The events are waited for on the loop of the producer, which is
+        # the one to block them.
+        if self.qsize() >= self.high_water and self.writable.is_set():
+            self._producer_loop = asyncio.get_running_loop()
+            self.writable.clear()
+            self.blocked.set()
+
+    def _pop(self):
+        item = super()._pop()
+        if (self.qsize() <= self.low_water and self.blocked.is_set()
+                and self._producer_loop is not None):
+            self._producer_loop.call_soon_threadsafe(self._unblock)
+        return item
+
+    def _unblock(self):
+        if self.blocked.is_set():
+            self.blocked.clear()
+            self.writable.set()
@@ -0,0 +1,327 @@
+import array
+import asyncio
+import collections
+import datetime
+import heapq
+import mmap
+import os
+import re
+import struct
+import time
+from bisect import bisect_left
+
+from .chat_reader import NICKNAME
+from .log import logger
+
+
+WORD = re.compile(r'\w+')
+
+RUN_SUFFIX = '.run'
+# Postings are absolute sequence numbers, so runs that follow each other
+# merge by concatenating the postings of a term.
+POSTING = 'I'
+POSTING_SIZE = array.array(POSTING).itemsize
+# term offset, term length, postings offset, postings count
+TERM_ENTRY = struct.Struct('<QIQI')
+# first seq, end seq, dictionary offset, terms count
+FOOTER = struct.Struct('<QQQQ')
+
+DEFAULT_RUN_SIZE = 100000
+DEFAULT_LIMIT = 100
+
+
+def extract_terms(line):
+    match = NICKNAME.match(line)
+    if match is None:
+        return set(WORD.findall(line.lower()))
+
+    # The timestamp would only add a few huge posting lists.
+    terms = set(WORD.findall(line[match.end():].lower()))
+    terms.add(f'@{match.group(1).strip().lower()}')
+    return terms
+
+
+def parse_date(text):
+    date = datetime.datetime.strptime(text, '%Y-%m-%d')
+    return time.mktime(date.timetuple())
+
+
+def parse_query(text):
+    words = []
+    nickname = since = until = None
+    for token in text.split():
+        key, _, value = token.partition(':')
+        if token.startswith('@') and len(token) > 1:
+            nickname = token[1:]
+        elif key == 'from' and value:
+            nickname = value
+        elif key == 'since' and value:
+            since = parse_date(value)
+        elif key == 'until' and value:
+            # The whole day is included.
+            until = parse_date(value) + 24 * 60 * 60
+        else:
+            words.extend(WORD.findall(token.lower()))
+
+    terms = sorted(set(words))
+    if nickname:
+        terms.append(f'@{nickname.lower()}')
+    return terms, since, until
+
+
+def write_run(path, first_seq, end_seq, postings):
+    tmp_path = f'{path}.tmp'
+    entries = bytearray()
+    terms = bytearray()
+    offset = 0
+    with open(tmp_path, 'wb') as run_file:
+        for term, chunks in postings:
+            count = 0
+            for chunk in chunks:
+                run_file.write(chunk)
+                count += len(chunk) // POSTING_SIZE
+            entries += TERM_ENTRY.pack(len(terms), len(term), offset, count)
+            terms += term
+            offset += count * POSTING_SIZE
+
+        run_file.write(entries)
+        run_file.write(terms)
+        run_file.write(FOOTER.pack(
+            first_seq, end_seq, offset, len(entries) // TERM_ENTRY.size
+        ))
+    os.replace(tmp_path, path)
+
+
+class IndexRun:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as run_file:
+            self.data = mmap.mmap(
+                run_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        footer_offset = len(self.data) - FOOTER.size
+        (self.first_seq, self.end_seq,
+         self.entries_offset, self.terms_count) = FOOTER.unpack_from(
+            self.data, footer_offset
+        )
+        self.terms_offset = (
+            self.entries_offset + self.terms_count * TERM_ENTRY.size
+        )
+
+    @property
+    def count(self):
+        return self.end_seq - self.first_seq
+
+    def entry(self, position):
+        return TERM_ENTRY.unpack_from(
+            self.data, self.entries_offset + position * TERM_ENTRY.size
+        )
+
+    def term(self, entry):
+        term_offset, term_length, _, _ = entry
+        start = self.terms_offset + term_offset
+        return self.data[start:start + term_length]
+
+    def postings_bytes(self, entry):
+        _, _, postings_offset, count = entry
+        end = postings_offset + count * POSTING_SIZE
+        return self.data[postings_offset:end]
+
+    def postings(self, term):
+        term = term.encode()
+        low, high = 0, self.terms_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(self.entry(middle)) < term:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.terms_count:
+            entry = self.entry(low)
+            if self.term(entry) == term:
+                # A view straight into the mapped file: even the longest
+                # postings are searched without copying them.
+                _, _, postings_offset, count = entry
+                end = postings_offset + count * POSTING_SIZE
+                with memoryview(self.data) as view:
+                    return view[postings_offset:end].cast(POSTING)
+        return array.array(POSTING)
+
+    def iter_terms(self):
+        for position in range(self.terms_count):
+            entry = self.entry(position)
+            yield self.term(entry), self.postings_bytes(entry)
+
+    def close(self):
+        self.data.close()
+
+
+def merge_runs(path, runs):
+    # Runs are passed in sequence order, so for every term the concatenated
+    # postings stay sorted.
+    def merged_terms():
+        streams = [
+            ((term, position, postings)
+             for term, postings in run.iter_terms())
+            for position, run in enumerate(runs)
+        ]
+        current_term, chunks = None, []
+        for term, _, postings in heapq.merge(*streams):
+            if term != current_term and chunks:
+                yield current_term, chunks
+                chunks = []
+            current_term = term
+            chunks.append(postings)
+        if chunks:
+            yield current_term, chunks
+
+    write_run(path, runs[0].first_seq, runs[-1].end_seq, merged_terms())
+
+
+class SearchIndex:
+
+    def __init__(self, directory, run_size=DEFAULT_RUN_SIZE):
+        self.directory = directory
+        self.run_size = run_size
+        self.runs = []
+        self.pending = collections.defaultdict(lambda: array.array(POSTING))
+        self.pending_first_seq = 0
+        self.next_seq = 0
+
+    def run_path(self, first_seq, end_seq):
+        return os.path.join(
+            self.directory, f'{first_seq:020d}-{end_seq:020d}{RUN_SUFFIX}'
+        )
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        ranges = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith(f'{RUN_SUFFIX}.tmp'):
+                os.remove(path)
+            elif filename.endswith(RUN_SUFFIX):
+                first_seq, end_seq = filename[:-len(RUN_SUFFIX)].split('-')
+                ranges.append((int(first_seq), -int(end_seq), path))
+
+        # A merge interrupted before its inputs were removed leaves runs
+        # covered by the merged one.
+        for first_seq, end_seq, path in sorted(ranges):
+            if first_seq < self.next_seq:
+                os.remove(path)
+                continue
+            self.runs.append(IndexRun(path))
+            self.next_seq = -end_seq
+
+        self.pending_first_seq = self.next_seq
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+
+    def add(self, first_seq, lines):
+        pending = self.pending
+        for seq, line in enumerate(lines, first_seq):
+            for term in extract_terms(line):
+                pending[term].append(seq)
+        self.next_seq = first_seq + len(lines)
+
+    async def update(self, store, chunk_size=10000):
+        while self.next_seq < store.next_seq:
+            lines = store.read(self.next_seq, chunk_size)
+            self.add(self.next_seq, lines)
+            if self.next_seq - self.pending_first_seq >= self.run_size:
+                await self.flush()
+            # Catching up with a long history must not freeze the window.
+            await asyncio.sleep(0)
+
+    async def flush(self):
+        if self.next_seq == self.pending_first_seq:
+            return
+
+        loop = asyncio.get_running_loop()
+        path = self.run_path(self.pending_first_seq, self.next_seq)
+        postings = [
+            (term.encode(), [self.pending[term].tobytes()])
+            for term in self.pending
+        ]
+        postings.sort()
+        await loop.run_in_executor(
+            None, write_run, path, self.pending_first_seq, self.next_seq,
+            postings
+        )
+
+        self.runs.append(IndexRun(path))
+        self.pending.clear()
+        self.pending_first_seq = self.next_seq
+        await self._compact()
+
+    async def _compact(self):
+        # Merge the newest runs while they are of similar size: every
+        # posting is rewritten a logarithmic number of times and only a
+        # logarithmic number of runs is searched.
+        loop = asyncio.get_running_loop()
+        while (len(self.runs) > 1
+               and self.runs[-1].count * 2 >= self.runs[-2].count):
+            runs = self.runs[-2:]
+            path = self.run_path(runs[0].first_seq, runs[-1].end_seq)
+            await loop.run_in_executor(None, merge_runs, path, runs)
+
+            self.runs[-2:] = [IndexRun(path)]
+            for run in runs:
+                run.close()
+                os.remove(run.path)
+            logger.debug('Объединены части поискового индекса: %s', path)
+
+    def search(self, terms, first_seq=0, end_seq=None, limit=DEFAULT_LIMIT):
+        if not terms:
+            return []
+
+        end_seq = self.next_seq if end_seq is None else end_seq
+        sources = [self.pending] + [
+            run for run in reversed(self.runs)
+            if run.first_seq < end_seq and run.end_seq > first_seq
+        ]
+
+        found = []
+        for source in sources:
+            if source is self.pending:
+                postings = [
+                    self.pending.get(term, array.array(POSTING))
+                    for term in terms
+                ]
+            else:
+                postings = [source.postings(term) for term in terms]
+            postings.sort(key=len)
+            rarest, others = postings[0], postings[1:]
+
+            # Newest matches first: walk the rarest term backwards and
+            # look the rest up by bisection.
+            position = bisect_left(rarest, end_seq)
+            stop = bisect_left(rarest, first_seq)
+            while position > stop:
+                position -= 1
+                seq = rarest[position]
+                if all(contains(other, seq) for other in others):
+                    found.append(seq)
+                    if len(found) == limit:
+                        return found
+        return found
+
+
+def contains(postings, seq):
+    position = bisect_left(postings, seq)
+    return position < len(postings) and postings[position] == seq
+
+
+async def keep_index_updated(store, search_index, interval=1):
+    try:
+        while True:
+            await search_index.update(store)
+            await asyncio.sleep(interval)
+    finally:
+        await asyncio.shield(search_index.flush())
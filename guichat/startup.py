@@ -0,0 +1,31 @@
+import time
+
+from .log import logger
+
+
+class StartupReport:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = []
+
+    def mark(self, stage):
+        self.stages.append((stage, time.perf_counter()))
+
+    def log(self):
+        # Same layout as `python -X importtime`, so both reports can be read
+        # side by side when hunting a regression in time-to-first-paint.
+        logger.info('startup: elapsed [ms] | stage [ms] | stage')
+        previous = self.started_at
+        for stage, marked_at in self.stages:
+            elapsed = (marked_at - self.started_at) * 1000
+            duration = (marked_at - previous) * 1000
+            logger.info(
+                f'startup: {elapsed:12.1f} | {duration:10.1f} | {stage}'
+            )
+            previous = marked_at
+
+
+# Entry scripts import this module before anything else, so the report
+# counts from the moment they start importing their dependencies.
+startup_report = StartupReport()
@@ -0,0 +1,409 @@
+import asyncio
+import contextlib
+import gzip
+import itertools
+import mmap
+import os
+import shutil
+import struct
+import time
+
+from aiofile import AIOFile
+
+from .log import logger
+
+
+INDEX_ENTRY = struct.Struct('<dQ')
+
+DATA_SUFFIX = '.log'
+COMPRESSED_SUFFIX = '.log.gz'
+INDEX_SUFFIX = '.idx'
+
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def map_file(path):
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def compress_file(source_path, target_path):
+    tmp_path = f'{target_path}.tmp'
+    with open(source_path, 'rb') as source:
+        with gzip.open(tmp_path, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+    os.replace(tmp_path, target_path)
+    os.remove(source_path)
+
+
+class Segment:
+
+    def __init__(self, directory, first_seq):
+        self.first_seq = first_seq
+        basename = os.path.join(directory, f'{first_seq:020d}')
+        self.data_path = f'{basename}{DATA_SUFFIX}'
+        self.compressed_path = f'{basename}{COMPRESSED_SUFFIX}'
+        self.index_path = f'{basename}{INDEX_SUFFIX}'
+        self.compressed = os.path.exists(self.compressed_path)
+        self.size = 0
+        self.index = b''
+        self._data = None
+
+    @property
+    def count(self):
+        return len(self.index) // INDEX_ENTRY.size
+
+    def load(self):
+        self.index = map_file(self.index_path)
+        if not self.compressed:
+            self.size = os.path.getsize(self.data_path)
+
+    def load_active(self):
+        with open(self.index_path, 'ab+') as index_file:
+            index_file.seek(0)
+            index = bytearray(index_file.read())
+        with open(self.data_path, 'ab'):
+            pass
+        self.size = os.path.getsize(self.data_path)
+        self.index = index
+
+        if self._recover():
+            with open(self.index_path, 'wb') as index_file:
+                index_file.write(self.index)
+            logger.debug(
+                'Восстановлен индекс сегмента истории %d.', self.first_seq
+            )
+
+    def _recover(self):
+        # Data is written before its index entries, so after a crash the
+        # index may lag behind or end with a torn entry. Data is the source
+        # of truth: drop dangling entries, index unindexed complete lines and
+        # cut off a trailing partial line.
+        index = self.index
+        initial_length = len(index)
+        del index[len(index) - len(index) % INDEX_ENTRY.size:]
+
+        data = map_file(self.data_path)
+        end = data.rfind(b'\n') + 1
+
+        while index and self.entry(self.count - 1)[1] >= end:
+            del index[-INDEX_ENTRY.size:]
+
+        position = 0
+        if index:
+            _, offset = self.entry(self.count - 1)
+            position = data.find(b'\n', offset, end) + 1
+
+        timestamp = os.path.getmtime(self.data_path)
+        while position < end:
+            index += INDEX_ENTRY.pack(timestamp, position)
+            position = data.find(b'\n', position, end) + 1
+
+        truncated = end != len(data)
+        if isinstance(data, mmap.mmap):
+            data.close()
+        if truncated:
+            os.truncate(self.data_path, end)
+            self.size = end
+
+        return truncated or len(index) != initial_length
+
+    def unpack(self):
+        with gzip.open(self.compressed_path, 'rb') as file:
+            return file.read()
+
+    async def unpack_in_executor(self):
+        # A sealed segment never changes, so it is safe to read and
+        # decompress in another thread.
+        if self.compressed and self._data is None:
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, self.unpack
+            )
+            if self._data is None:
+                self._data = data
+
+    def data(self):
+        if self.compressed:
+            if self._data is None:
+                self._data = self.unpack()
+        elif self._data is None or len(self._data) < self.size:
+            self._data = map_file(self.data_path)
+        return self._data
+
+    def release(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def close(self):
+        self.release()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+
+    def entry(self, position):
+        return INDEX_ENTRY.unpack_from(self.index, position * INDEX_ENTRY.size)
+
+    def read_raw(self, start, stop):
+        data = self.data()
+        entries = [self.entry(position) for position in range(start, stop)]
+        ends = [offset for _, offset in entries[1:]]
+        ends.append(self.entry(stop)[1] if stop < self.count else len(data))
+        return [
+            (timestamp, data[begin:end - 1])
+            for (timestamp, begin), end in zip(entries, ends)
+        ]
+
+    def find(self, timestamp):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+class HistoryStore:
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE,
+                 compress=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compress = compress
+        self.segments = []
+        self._data_file = None
+        self._index_file = None
+        self._unpacked_segment = None
+
+    @property
+    def first_seq(self):
+        return self.segments[0].first_seq
+
+    @property
+    def next_seq(self):
+        active = self.segments[-1]
+        return active.first_seq + active.count
+
+    async def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        first_seqs = sorted({
+            int(filename.split('.')[0])
+            for filename in os.listdir(self.directory)
+            if filename.endswith(INDEX_SUFFIX)
+        })
+        self.segments = [
+            Segment(self.directory, first_seq) for first_seq in first_seqs
+        ] or [Segment(self.directory, 0)]
+
+        for segment in self.segments[:-1]:
+            segment.load()
+
+        await self._open_active(self.segments[-1])
+
+    async def close(self):
+        await self._close_active()
+        for segment in self.segments:
+            segment.close()
+
+    async def _open_active(self, segment):
+        segment.load_active()
+        self._data_file = AIOFile(segment.data_path, 'ab')
+        self._index_file = AIOFile(segment.index_path, 'ab')
+        await self._data_file.open()
+        await self._index_file.open()
+
+    async def _close_active(self):
+        for afp in (self._data_file, self._index_file):
+            if afp is not None:
+                await afp.close()
+        self._data_file = self._index_file = None
+
+    async def _rotate(self):
+        sealed = self.segments[-1]
+        await self._close_active()
+        sealed.index = bytes(sealed.index)
+
+        segment = Segment(self.directory, self.next_seq)
+        self.segments.append(segment)
+        await self._open_active(segment)
+
+        if self.compress:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, compress_file, sealed.data_path, sealed.compressed_path
+            )
+            sealed.release()
+            sealed.compressed = True
+
+    async def append(self, messages, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        await self.append_raw([
+            (timestamp, message.replace('\n', ' ').encode())
+            for message in messages
+        ])
+
+    async def append_messages(self, messages):
+        # Chat messages keep the bytes read from the socket, a line without
+        # a line break, and are stamped with their own receive time.
+        for seq, message in enumerate(messages, self.next_seq):
+            message.seq = seq
+        await self.append_raw([
+            (message.received_at, message.raw) for message in messages
+        ])
+
+    async def append_raw(self, lines):
+        # A half-written batch would leave the index out of step with the
+        # data, so a started append is finished even if the caller is
+        # cancelled meanwhile.
+        task = asyncio.ensure_future(self._append(lines))
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            await task
+            raise
+
+    async def _append(self, lines):
+        data = bytearray()
+        entries = bytearray()
+        for timestamp, line in lines:
+            if self.segments[-1].size + len(data) >= self.segment_size:
+                await self._write(data, entries)
+                data = bytearray()
+                entries = bytearray()
+                await self._rotate()
+
+            offset = self.segments[-1].size + len(data)
+            entries += INDEX_ENTRY.pack(timestamp, offset)
+            data += line
+            data += b'\n'
+
+        await self._write(data, entries)
+
+    async def _write(self, data, entries):
+        if not data:
+            return
+
+        segment = self.segments[-1]
+        await self._data_file.write(bytes(data), segment.size)
+        await self._index_file.write(bytes(entries), len(segment.index))
+        segment.size += len(data)
+        segment.index += entries
+
+    async def fsync(self):
+        await self._data_file.fsync()
+        await self._index_file.fsync()
+
+    def _segment_position(self, seq):
+        low, high = 0, len(self.segments) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.segments[middle].first_seq <= seq:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def read(self, seq, count):
+        return [
+            line.decode(errors='replace')
+            for _, line in self.read_raw(seq, count)
+        ]
+
+    def read_latest_raw(self, count):
+        # The bytes as read from the server, the way the dedup ring compares
+        # lines: decoding with replacement would not round-trip.
+        return [
+            line for _, line in self.read_raw(self.next_seq - count, count)
+        ]
+
+    def read_raw(self, seq, count):
+        seq = max(seq, self.first_seq)
+        stop_seq = min(seq + count, self.next_seq)
+        messages = []
+        position = self._segment_position(seq)
+        while seq < stop_seq:
+            segment = self.segments[position]
+            if segment.compressed:
+                self._keep_unpacked(segment)
+            start = seq - segment.first_seq
+            stop = min(stop_seq - segment.first_seq, segment.count)
+            messages.extend(segment.read_raw(start, stop))
+            seq = segment.first_seq + stop
+            position += 1
+        return messages
+
+    async def read_lines(self, seqs):
+        # Lines scattered over the history, e.g. search hits: every sealed
+        # segment is decompressed once and in the executor, the lines are
+        # cut out on the loop.
+        lines = {}
+        for position, group in itertools.groupby(
+                sorted(set(seqs)), self._segment_position):
+            segment = self.segments[position]
+            if segment.compressed:
+                await segment.unpack_in_executor()
+                self._keep_unpacked(segment)
+            for seq in group:
+                start = seq - segment.first_seq
+                _, line = segment.read_raw(start, start + 1)[0]
+                lines[seq] = line.decode(errors='replace')
+        return [lines[seq] for seq in seqs]
+
+    def _keep_unpacked(self, segment):
+        # Only one decompressed sealed segment is held in memory at a time.
+        if self._unpacked_segment not in (None, segment):
+            self._unpacked_segment.release()
+        self._unpacked_segment = segment
+
+    def find_seq(self, timestamp):
+        for segment in reversed(self.segments):
+            if segment.count and segment.entry(0)[0] < timestamp:
+                return segment.first_seq + segment.find(timestamp)
+        return self.first_seq
+
+
+@contextlib.asynccontextmanager
+async def open_history_store(directory, segment_size=DEFAULT_SEGMENT_SIZE,
+                             compress=False):
+    store = HistoryStore(directory, segment_size, compress)
+    await store.open()
+    try:
+        yield store
+    finally:
+        await store.close()
+
+
+async def import_flat_history(store, filepath):
+    if store.next_seq or not os.path.exists(filepath):
+        return 0
+
+    timestamp = os.path.getmtime(filepath)
+    imported = 0
+    offset = 0
+    tail = b''
+    async with AIOFile(filepath, 'rb') as afp:
+        while True:
+            chunk = await afp.read(CHUNK_SIZE, offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+
+            *lines, tail = (tail + chunk).split(b'\n')
+            await store.append(
+                [line.decode(errors='replace') for line in lines],
+                timestamp
+            )
+            imported += len(lines)
+
+    if tail:
+        await store.append([tail.decode(errors='replace')], timestamp)
+        imported += 1
+
+    logger.debug('Перенесено сообщений: %d', imported)
+    return imported
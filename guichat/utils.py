@@ -1,8 +1,15 @@
 import asyncio
+import concurrent.futures
 import contextlib
+import threading
 
 import aionursery
 
+from .log import logger
+
+
+LOOP_BACKENDS = ('asyncio', 'uvloop')
+
 
 @contextlib.asynccontextmanager
 async def create_handy_nursery():
@@ -13,3 +20,55 @@ async def create_handy_nursery():
         if len(e.exceptions) == 1:
             raise e.exceptions[0]
         raise
+
+
+def install_event_loop(backend='asyncio'):
+    if backend not in LOOP_BACKENDS:
+        raise ValueError(f'Unknown event loop backend: {backend}')
+
+    if backend == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning(
+                'uvloop не установлен, используется цикл событий asyncio.'
+            )
+            return 'asyncio'
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    return backend
+
+
+async def run_in_thread(coroutine_function, *args):
+    # Runs the coroutine on an event loop of its own thread. Cancelling the
+    # caller cancels it there and waits until its cleanup is finished.
+    started = concurrent.futures.Future()
+    finished = concurrent.futures.Future()
+
+    async def run():
+        started.set_result(
+            (asyncio.get_running_loop(), asyncio.current_task())
+        )
+        return await coroutine_function(*args)
+
+    def target():
+        try:
+            finished.set_result(asyncio.run(run()))
+        except BaseException as err:
+            finished.set_exception(err)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    loop, task = await asyncio.wrap_future(started)
+    result = asyncio.wrap_future(finished)
+    try:
+        return await asyncio.shield(result)
+    finally:
+        if not finished.done():
+            loop.call_soon_threadsafe(task.cancel)
+            await asyncio.shield(
+                asyncio.get_running_loop().run_in_executor(None, thread.join)
+            )
+        # The result of an abandoned run is of no interest.
+        result.add_done_callback(lambda future: future.cancelled() or (
+            future.exception()))
@@ -2,43 +2,75 @@ import asyncio
 import logging
 import time
 
-from async_timeout import timeout
 from .chat_writer import write_message
-from .chat_reader import read_message
 
 
 watchdog_logger = logging.getLogger(__name__)
 
 
-async def watch_for_connection(watchdog_queue, conn_timeout=10):
-    while True:
-        current_timestamp = int(time.time())
+class Liveness:
 
-        try:
-            async with timeout(conn_timeout):
-                event = await watchdog_queue.get()
-                watchdog_logger.debug(
-                    f'[{current_timestamp}] Connection is alive. {event}'
-                )
+    __slots__ = ('last_activity', 'idle', 'expired')
 
-        except asyncio.TimeoutError:
-            watchdog_logger.debug(
-                f'[{current_timestamp}] {conn_timeout}s timeout is elapsed'
-            )
-            raise ConnectionError
+    def __init__(self):
+        self.last_activity = time.monotonic()
+        self.idle = asyncio.Event()
+        self.expired = asyncio.Event()
 
+    def touch(self):
+        self.last_activity = time.monotonic()
 
-async def ping_pong(
-        reader, writer, watchdog_queue, conn_timeout=5, delay_send=10):
 
-    while True:
-        try:
-            async with timeout(conn_timeout):
-                await write_message(writer)
-                await reader.readline()
+class LivenessMonitor:
+
+    def __init__(self, conn_timeout=10, ping_after=5, interval=1):
+        self.conn_timeout = conn_timeout
+        self.ping_after = ping_after
+        self.interval = interval
+        self.connections = set()
+
+    def register(self):
+        liveness = Liveness()
+        self.connections.add(liveness)
+        return liveness
+
+    def unregister(self, liveness):
+        self.connections.discard(liveness)
+
+    def max_idle(self):
+        now = time.monotonic()
+        return max(
+            (now - liveness.last_activity for liveness in self.connections),
+            default=0
+        )
 
-            watchdog_queue.put_nowait('Ping message sent')
-            await asyncio.sleep(delay_send)
+    async def run(self):
+        # One timer serves every connection: activity only stamps the time,
+        # and deadlines are checked here once per interval.
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for liveness in self.connections:
+                idle_for = now - liveness.last_activity
+                if idle_for >= self.conn_timeout:
+                    liveness.expired.set()
+                elif idle_for >= self.ping_after:
+                    liveness.idle.set()
+
+
+async def watch_for_connection(liveness):
+    await liveness.expired.wait()
+    watchdog_logger.debug(
+        '[%d] Connection timeout is elapsed', int(time.time())
+    )
+    raise ConnectionError
+
+
+async def ping_pong(reader, writer, liveness):
+    while True:
+        await liveness.idle.wait()
+        liveness.idle.clear()
 
-        except asyncio.TimeoutError as err:
-            raise ConnectionError
+        await write_message(writer)
+        await reader.readline()
+        liveness.touch()
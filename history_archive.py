@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from guichat.archive import (
+    DEFAULT_CHUNK_LINES,
+    DEFAULT_LEVEL,
+    export_history,
+    import_archive,
+    is_archive
+)
+from guichat.storage import open_history_store
+
+
+logging.getLogger('asyncio').setLevel(logging.WARNING)
+
+logger = logging.getLogger(__name__)
+
+
+async def export_command(args):
+    if args.restart and os.path.exists(args.archive):
+        os.remove(args.archive)
+
+    async with open_history_store(args.history_dir) as store:
+        started_at = time.monotonic()
+        exported = await export_history(
+            store, args.archive, args.chunk_lines, args.level
+        )
+        elapsed = time.monotonic() - started_at
+
+    size = os.path.getsize(args.archive)
+    print(
+        f'Exported {exported} messages in {elapsed:.1f} s, '
+        f'{exported / max(elapsed, 1e-9):.0f} msgs/s. '
+        f'Archive {args.archive}: {size / 1024 ** 2:.1f} MB'
+    )
+
+
+async def import_command(args):
+    if not is_archive(args.archive):
+        sys.exit(f'{args.archive} is not a history archive.')
+
+    async with open_history_store(args.history_dir) as store:
+        had_lines = store.next_seq
+        started_at = time.monotonic()
+        imported = await import_archive(store, args.archive)
+        elapsed = time.monotonic() - started_at
+
+    if had_lines and not imported:
+        sys.exit(
+            f'{args.history_dir} already holds another history, import '
+            f'into an empty directory.'
+        )
+    print(
+        f'Imported {imported} messages in {elapsed:.1f} s, '
+        f'{imported / max(elapsed, 1e-9):.0f} msgs/s, into '
+        f'{args.history_dir}'
+    )
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        description='Export the chat history to a compressed archive or '
+                    'import it back. An interrupted export or import '
+                    'continues where it stopped when run again, a repeated '
+                    'export appends only the new messages.'
+    )
+    parser.add_argument(
+        '--history-dir', default=os.getenv('CHAT_HISTORY_DIR', 'chat_history')
+    )
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    export_parser = commands.add_parser('export')
+    export_parser.add_argument('archive')
+    export_parser.add_argument(
+        '--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES,
+        help='Messages per compressed chunk.'
+    )
+    export_parser.add_argument(
+        '--level', type=int, default=DEFAULT_LEVEL, choices=range(1, 10),
+        help='gzip compression level.'
+    )
+    export_parser.add_argument(
+        '--restart', action='store_true',
+        help='Overwrite the archive instead of continuing it.'
+    )
+    export_parser.set_defaults(run=export_command)
+
+    import_parser = commands.add_parser('import')
+    import_parser.add_argument('archive')
+    import_parser.set_defaults(run=import_command)
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(format='%(message)s')
+    load_dotenv()
+
+    args = process_args()
+    asyncio.run(args.run(args))
+
+
+if __name__ == '__main__':
+    main()
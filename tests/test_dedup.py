@@ -0,0 +1,63 @@
+from guichat.dedup import RecentMessages
+
+
+def test_new_messages_pass_without_reconnect():
+    recent = RecentMessages()
+
+    assert recent.is_new(b'hello')
+    assert recent.is_new(b'hello')
+    assert recent.dropped == 0
+
+
+def test_backlog_is_dropped_after_reconnect():
+    recent = RecentMessages()
+    recent.remember_all([b'one', b'two', b'three'])
+
+    recent.resume()
+    assert recent.catching_up
+    assert [recent.is_new(line) for line in [b'two', b'three', b'four']] == [
+        False, False, True
+    ]
+    assert not recent.catching_up
+    assert recent.dropped == 2
+
+
+def test_repeated_line_after_backlog_is_new():
+    recent = RecentMessages()
+    recent.remember_all([b'one', b'two'])
+
+    recent.resume()
+    assert not recent.is_new(b'two')
+    assert recent.is_new(b'two')
+
+
+def test_unseen_line_ends_catching_up():
+    recent = RecentMessages()
+    recent.remember_all([b'one', b'two'])
+
+    recent.resume()
+    assert recent.is_new(b'three')
+    assert recent.is_new(b'one')
+
+
+def test_window_forgets_oldest_lines():
+    recent = RecentMessages(window=2)
+    recent.remember_all([b'one', b'two', b'three'])
+
+    recent.resume()
+    assert recent.is_new(b'one')
+
+
+def test_window_counts_repeated_lines():
+    recent = RecentMessages(window=2)
+    recent.remember_all([b'same', b'same', b'other'])
+
+    recent.resume()
+    assert not recent.is_new(b'same')
+
+
+def test_resume_without_history_does_not_catch_up():
+    recent = RecentMessages()
+
+    recent.resume()
+    assert not recent.catching_up
@@ -0,0 +1,91 @@
+from guichat.queues import BoundedQueue, SpillQueue
+
+
+def drain(queue):
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_drop_oldest():
+    queue = BoundedQueue(2, overflow='drop-oldest')
+    for item in range(4):
+        queue.put_nowait(item)
+
+    assert drain(queue) == [2, 3]
+    assert queue.dropped == 2
+
+
+def test_drop_newest():
+    queue = BoundedQueue(2, overflow='drop-newest')
+    for item in range(4):
+        queue.put_nowait(item)
+
+    assert drain(queue) == [0, 1]
+    assert queue.dropped == 2
+
+
+def test_coalesce_replaces_item_of_same_kind():
+    queue = BoundedQueue(2, overflow='coalesce', coalesce_key=lambda item: (
+        item[0]
+    ))
+    for item in ['a1', 'b1', 'a2', 'c1']:
+        queue.put_nowait(item)
+
+    assert drain(queue) == ['b1', 'a2']
+    assert queue.dropped == 2
+
+
+def test_non_droppable_item_is_never_lost():
+    for overflow in ('drop-oldest', 'drop-newest', 'coalesce'):
+        queue = BoundedQueue(
+            2, overflow=overflow, droppable=lambda item: item != 'page'
+        )
+        queue.put_nowait('page')
+        queue.put_nowait('page')
+        queue.put_nowait('page')
+        queue.put_nowait('message')
+
+        assert drain(queue) == ['page', 'page', 'page'], overflow
+        assert queue.dropped == 1
+
+
+def test_drop_oldest_keeps_non_droppable_items():
+    queue = BoundedQueue(
+        2, overflow='drop-oldest', droppable=lambda item: item != 'page'
+    )
+    for item in ['page', 'message 1', 'message 2']:
+        queue.put_nowait(item)
+
+    assert drain(queue) == ['page', 'message 2']
+
+
+def test_spill_queue_keeps_order(tmp_path):
+    spill_path = tmp_path / 'spill.jsonl'
+    queue = SpillQueue(2, spill_path)
+    for item in range(5):
+        queue.put_nowait(item)
+
+    assert queue.qsize() == 5
+    assert queue.spilled == 3
+    queue.put_nowait(5)
+    assert drain(queue) == [0, 1, 2, 3, 4, 5]
+    assert queue.spilled_total == 4
+
+    queue.close()
+    assert not spill_path.exists()
+
+
+def test_spilled_items_survive_reopen(tmp_path):
+    spill_path = tmp_path / 'spill.jsonl'
+    queue = SpillQueue(2, spill_path)
+    for item in range(5):
+        queue.put_nowait([item])
+    queue.close()
+
+    queue = SpillQueue(2, spill_path)
+    assert queue.qsize() == 3
+    queue.put_nowait([5])
+    assert drain(queue) == [[2], [3], [4], [5]]
+    queue.close()
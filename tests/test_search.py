@@ -0,0 +1,96 @@
+import asyncio
+import os
+import shutil
+
+from guichat.search import SearchIndex, extract_terms, parse_query
+
+
+def lines(first_seq, count):
+    return [
+        f'[01.01.21 12:00] user{seq % 3}: message number{seq} '
+        f'{"even" if seq % 2 == 0 else "odd"}'
+        for seq in range(first_seq, first_seq + count)
+    ]
+
+
+async def add_batches(directory, batches, run_size=10):
+    search_index = SearchIndex(directory, run_size)
+    search_index.open()
+    for first_seq, count in batches:
+        search_index.add(first_seq, lines(first_seq, count))
+        await search_index.flush()
+    return search_index
+
+
+def run_files(directory):
+    return sorted(
+        filename for filename in os.listdir(directory)
+        if filename.endswith('.run')
+    )
+
+
+def test_extract_terms():
+    assert extract_terms('[01.01.21 12:00] Vasya: Hello, World') == {
+        '@vasya', 'hello', 'world'
+    }
+    assert extract_terms('Server notice') == {'server', 'notice'}
+
+
+def test_parse_query():
+    terms, since, until = parse_query('Hello from:Vasya since:2021-01-01')
+
+    assert terms == ['hello', '@vasya']
+    assert since is not None
+    assert until is None
+
+
+def test_pending_lines_are_searched():
+    search_index = SearchIndex('unused')
+    search_index.add(0, lines(0, 6))
+
+    assert search_index.search(['even']) == [4, 2, 0]
+    assert search_index.search(['even', '@user0']) == [0]
+
+
+def test_runs_are_merged(tmp_path):
+    search_index = asyncio.run(
+        add_batches(tmp_path, [(0, 10), (10, 10), (20, 10)])
+    )
+
+    assert len(search_index.runs) == 1
+    assert run_files(tmp_path) == [f'{0:020d}-{30:020d}.run']
+    assert search_index.search(['number25']) == [25]
+    assert search_index.search(['odd', '@user1'], limit=2) == [25, 19]
+    assert search_index.search(['even'], first_seq=8, end_seq=14) == [
+        12, 10, 8
+    ]
+    search_index.close()
+
+
+def test_index_is_reopened(tmp_path):
+    asyncio.run(add_batches(tmp_path, [(0, 10), (10, 10)])).close()
+
+    search_index = SearchIndex(tmp_path)
+    search_index.open()
+    assert search_index.next_seq == 20
+    assert search_index.search(['@user2', 'even']) == [14, 8, 2]
+
+    search_index.add(20, lines(20, 4))
+    assert search_index.search(['@user2', 'even']) == [20, 14, 8, 2]
+    search_index.close()
+
+
+def test_runs_covered_by_merge_are_removed(tmp_path):
+    first_run = f'{0:020d}-{10:020d}.run'
+    asyncio.run(add_batches(tmp_path, [(0, 10)])).close()
+    shutil.copy(tmp_path / first_run, tmp_path / 'saved')
+    asyncio.run(add_batches(tmp_path, [(10, 10)])).close()
+    shutil.copy(tmp_path / 'saved', tmp_path / first_run)
+    (tmp_path / 'unfinished.run.tmp').write_bytes(b'')
+
+    search_index = SearchIndex(tmp_path)
+    search_index.open()
+    assert run_files(tmp_path) == [f'{0:020d}-{20:020d}.run']
+    assert not (tmp_path / 'unfinished.run.tmp').exists()
+    assert search_index.search(['number3']) == [3]
+    search_index.close()
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+from guichat.storage import INDEX_ENTRY, open_history_store
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def append_lines(directory, lines, **options):
+    async with open_history_store(directory, **options) as store:
+        await store.append_raw([
+            (timestamp, line.encode()) for timestamp, line in lines
+        ])
+
+
+async def read_all(directory, **options):
+    async with open_history_store(directory, **options) as store:
+        return store.first_seq, store.next_seq, store.read(0, store.next_seq)
+
+
+def test_lines_survive_reopen(tmp_path):
+    run(append_lines(tmp_path, [(1, 'first'), (2, 'second')]))
+    run(append_lines(tmp_path, [(3, 'third')]))
+
+    assert run(read_all(tmp_path)) == (0, 3, ['first', 'second', 'third'])
+
+
+def test_segments_rotate_and_compress(tmp_path):
+    lines = [(seq, f'message {seq}') for seq in range(50)]
+    run(append_lines(tmp_path, lines, segment_size=100, compress=True))
+
+    filenames = os.listdir(tmp_path)
+    assert any(filename.endswith('.log.gz') for filename in filenames)
+
+    async def check():
+        async with open_history_store(
+                tmp_path, segment_size=100, compress=True) as store:
+            assert len(store.segments) > 2
+            assert store.read(0, 50) == [line for _, line in lines]
+            assert store.read(45, 10) == [line for _, line in lines[45:]]
+            seqs = [42, 3, 17, 3]
+            assert await store.read_lines(seqs) == [
+                lines[seq][1] for seq in seqs
+            ]
+            assert store.find_seq(10) == 10
+    run(check())
+
+
+def test_torn_index_entry_is_dropped(tmp_path):
+    run(append_lines(tmp_path, [(1, 'first'), (2, 'second')]))
+    index_path = tmp_path / f'{0:020d}.idx'
+    with open(index_path, 'ab') as index_file:
+        index_file.write(INDEX_ENTRY.pack(3, 1000)[:5])
+
+    assert run(read_all(tmp_path)) == (0, 2, ['first', 'second'])
+    assert index_path.stat().st_size == 2 * INDEX_ENTRY.size
+
+
+def test_index_entry_past_data_is_dropped(tmp_path):
+    run(append_lines(tmp_path, [(1, 'first'), (2, 'second')]))
+    with open(tmp_path / f'{0:020d}.idx', 'ab') as index_file:
+        index_file.write(INDEX_ENTRY.pack(3, 1000))
+
+    assert run(read_all(tmp_path)) == (0, 2, ['first', 'second'])
+
+
+def test_unindexed_lines_are_indexed(tmp_path):
+    run(append_lines(tmp_path, [(1, 'first')]))
+    with open(tmp_path / f'{0:020d}.log', 'ab') as data_file:
+        data_file.write(b'second\nthird\n')
+
+    assert run(read_all(tmp_path)) == (0, 3, ['first', 'second', 'third'])
+
+
+def test_partial_line_is_truncated(tmp_path):
+    run(append_lines(tmp_path, [(1, 'first'), (2, 'second')]))
+    data_path = tmp_path / f'{0:020d}.log'
+    with open(data_path, 'ab') as data_file:
+        data_file.write(b'half a li')
+
+    assert run(read_all(tmp_path)) == (0, 2, ['first', 'second'])
+    assert data_path.read_bytes() == b'first\nsecond\n'
+
+    run(append_lines(tmp_path, [(3, 'third')]))
+    assert run(read_all(tmp_path)) == (0, 3, ['first', 'second', 'third'])
@@ -4,17 +4,23 @@ import json
 import logging
 import os
 import sys
+import time
 import tkinter as tk
 from tkinter import messagebox
 
 from aiofile import AIOFile
+from async_timeout import timeout
 from dotenv import load_dotenv
 from guichat.chat_reader import read_message
 from guichat.chat_writer import write_message
-from guichat.gui import update_tk
+from guichat.gui import run_tk_loop, TK_LOOPS
 from guichat.gui import TkAppClosed
-from guichat.connection import create_connection
-from guichat.utils import create_handy_nursery
+from guichat.connection import create_connection, ReconnectPolicy
+from guichat.utils import (
+    create_handy_nursery,
+    install_event_loop,
+    LOOP_BACKENDS
+)
 
 
 logging.getLogger('asyncio').setLevel(logging.WARNING)
@@ -27,8 +33,37 @@ class RegistrationComplete(Exception):
     pass
 
 
+class RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        # Slots are handed out in turn, so concurrent workers together stay
+        # within the rate without a lock.
+        now = asyncio.get_running_loop().time()
+        self.next_at = max(self.next_at, now)
+        delay = self.next_at - now
+        self.next_at += self.interval
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class BulkStats:
+
+    def __init__(self):
+        self.registered = 0
+        self.failed = 0
+        self.retries = 0
+
+
 async def register_new_user(host, port, reg_queue, filepath=None):
-    async with create_connection(host, port) as (reader, writer):
+    # The window waits for the server however long it is away.
+    policy = ReconnectPolicy()
+    async with create_connection(host, port, policy) as (reader, writer):
         username = ''
         while not username:
             username = await reg_queue.get()
@@ -72,13 +107,104 @@ async def save_token(filepath, token):
         await afp.write(token)
 
 
+async def register_with_retries(
+        host, port, username, policy, limiter, stats, retries,
+        registration_timeout):
+
+    for attempt in range(retries + 1):
+        if attempt:
+            stats.retries += 1
+            await asyncio.sleep(policy.delay(attempt - 1))
+        await limiter.wait()
+        try:
+            async with timeout(registration_timeout):
+                async with create_connection(host, port) as streams:
+                    user_data = await request_for_registration(
+                        *streams, username
+                    )
+            return user_data['account_hash']
+        except (
+            ConnectionError,
+            asyncio.TimeoutError,
+            TypeError,
+            KeyError,
+            ValueError
+        ) as err:
+            logger.debug(f'Регистрация {username} не удалась: {err!r}')
+
+    logger.warning(f'Не удалось зарегистрировать пользователя {username}')
+    stats.failed += 1
+    return None
+
+
+async def run_registration_worker(
+        usernames, tokens, host, port, policy, limiter, stats, retries,
+        registration_timeout):
+
+    # Workers share one iterator, each takes the next username when it is
+    # done with the previous one.
+    for position, username in usernames:
+        tokens[position] = await register_with_retries(
+            host, port, username, policy, limiter, stats, retries,
+            registration_timeout
+        )
+
+
+def read_usernames(filepath):
+    with open(filepath) as usernames_file:
+        return [line.strip() for line in usernames_file if line.strip()]
+
+
+async def register_users(
+        host, port, usernames_file, tokens_file, connections=50, rate=0,
+        retries=3, registration_timeout=10):
+
+    usernames = read_usernames(usernames_file)
+    tokens = [None] * len(usernames)
+    stats = BulkStats()
+    policy = ReconnectPolicy()
+    limiter = RateLimiter(rate)
+    pending = enumerate(usernames)
+
+    started_at = time.monotonic()
+    try:
+        async with create_handy_nursery() as nursery:
+            for _ in range(min(connections, len(usernames))):
+                nursery.start_soon(
+                    run_registration_worker(
+                        pending, tokens, host, port, policy, limiter, stats,
+                        retries, registration_timeout
+                    )
+                )
+    finally:
+        elapsed = time.monotonic() - started_at
+        # Tokens of an interrupted run are kept too, in one write. Every
+        # token is next to its username, a failed registration leaves no
+        # line and does not shift the others.
+        registered = [
+            (username, token)
+            for username, token in zip(usernames, tokens) if token
+        ]
+        await save_token(tokens_file, ''.join(
+            f'{username}\t{token}\n' for username, token in registered
+        ))
+
+        stats.registered = len(registered)
+        print(
+            f'Registered {stats.registered} of {len(usernames)} users in '
+            f'{elapsed:.1f} s: {stats.registered / elapsed:.1f} regs/s, '
+            f'failed {stats.failed}, retries {stats.retries}. '
+            f'Tokens are saved to {tokens_file}'
+        )
+
+
 def get_username(username_input, reg_queue):
     username = username_input.get()
     reg_queue.put_nowait(username)
     username_input.delete(0, tk.END)
 
 
-async def draw_registration_window(reg_queue):
+async def draw_registration_window(reg_queue, tk_loop='polling'):
     root = tk.Tk()
     root.title('Регистрация нового пользователя')
 
@@ -104,7 +230,7 @@ async def draw_registration_window(reg_queue):
     register_button.pack(pady=10)
 
     async with create_handy_nursery() as nursery:
-        nursery.start_soon(update_tk(root_frame))
+        nursery.start_soon(run_tk_loop(root_frame, tk_loop))
 
 
 def process_args():
@@ -112,6 +238,46 @@ def process_args():
     parser.add_argument(
         '--debug', action="store_true", help='Debug mode.'
     )
+    parser.add_argument(
+        '--tk-loop',
+        choices=TK_LOOPS,
+        default=os.getenv('CHAT_TK_LOOP', 'polling'),
+        help='How the window is updated: polling at a fixed rate or '
+             'adaptive, slowing down while idle.'
+    )
+    parser.add_argument(
+        '--loop',
+        choices=LOOP_BACKENDS,
+        default=os.getenv('CHAT_LOOP_BACKEND', 'asyncio'),
+        help='Event loop backend, uvloop is used only if installed.'
+    )
+    parser.add_argument(
+        '--bulk', metavar='USERNAMES_FILE',
+        help='Register every username of the file, one per line, without '
+             'the window.'
+    )
+    parser.add_argument(
+        '--tokens-file', default='tokens.txt',
+        help='Where --bulk writes the tokens, a username and its token '
+             'separated by a tab on each line.'
+    )
+    parser.add_argument(
+        '--connections', type=int, default=50,
+        help='Registrations running at the same time with --bulk.'
+    )
+    parser.add_argument(
+        '--rate', type=float, default=0,
+        help='Registrations started per second with --bulk, 0 is '
+             'unlimited.'
+    )
+    parser.add_argument(
+        '--retries', type=int, default=3,
+        help='Attempts after a failed registration with --bulk.'
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=10,
+        help='Seconds for one registration with --bulk.'
+    )
 
     return parser.parse_args()
 
@@ -131,11 +297,24 @@ async def main():
     chat_server = os.getenv('CHAT_SERVER')
     port_send = os.getenv('CHAT_PORT_SEND')
 
+    if args.bulk:
+        await register_users(
+            chat_server,
+            port_send,
+            args.bulk,
+            args.tokens_file,
+            args.connections,
+            args.rate,
+            args.retries,
+            args.timeout
+        )
+        return
+
     registration_queue = asyncio.Queue()
 
     async with create_handy_nursery() as nursery:
         nursery.start_soon(
-            draw_registration_window(registration_queue)
+            draw_registration_window(registration_queue, args.tk_loop)
         )
 
         nursery.start_soon(
@@ -144,6 +323,10 @@ async def main():
 
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s')
+    load_dotenv()
+    install_event_loop(process_args().loop)
+
     try:
         asyncio.run(main())
     except (TkAppClosed, KeyboardInterrupt, RegistrationComplete) as err: